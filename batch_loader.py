@@ -0,0 +1,194 @@
+""" Параллельная загрузка нескольких осциллограмм в пуле процессов.
+
+Каждый файл разбирается в отдельном процессе, каналы записываются в блок разделяемой памяти
+(multiprocessing.shared_memory), а основной процесс подключается к нему без копирования данных."""
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from capture_file import CAPTURE_EXTENSION, CaptureFile, narrow_dtype, read_table, split_time_line
+from channel_statistics import ChannelStatistics
+from columnar_file import COLUMNAR_EXTENSIONS, open_columnar
+
+
+@dataclass
+class SharedCaptureInfo:
+    """ Описание каналов, записанных процессом пула в разделяемую память."""
+    file_path: str
+    shared_name: str
+    channels_number: int
+    values_number: int
+    experiment_time: float
+    dtypes: list
+    statistics: ChannelStatistics = None
+
+
+def channel_offsets(dtypes, values_number):
+    """ Вычисляет смещения каналов в блоке разделяемой памяти. Каналы лежат подряд, каждый в своём типе
+    данных, начало каждого канала выровнено на 8 байт.
+    :param dtypes: типы данных каналов.
+    :param values_number: количество отсчётов в каждом канале.
+    :return: смещения каналов и общий размер блока в байтах."""
+    offsets = []
+    size = 0
+    for dtype in dtypes:
+        offsets.append(size)
+        size += -(-np.dtype(dtype).itemsize * values_number // 8) * 8
+    return offsets, size
+
+
+class SharedChannels:
+    """ Класс каналов, хранящихся в блоке разделяемой памяти.
+    Предоставляет каналы в том же виде, что и CaptureFile."""
+    def __init__(self, info):
+        """ :param info: описание блока SharedCaptureInfo."""
+        self.file_path = info.file_path
+        self.experiment_time = info.experiment_time
+        self.channels_number = info.channels_number
+        self.values_number = info.values_number
+        self._shared = shared_memory.SharedMemory(name=info.shared_name)
+        offsets, _ = channel_offsets(info.dtypes, self.values_number)
+        self._channels = [np.ndarray((self.values_number,), dtype=dtype, buffer=self._shared.buf, offset=offset)
+                          for dtype, offset in zip(info.dtypes, offsets)]
+        self.statistics = info.statistics
+        if self.statistics is None:
+            self.statistics = ChannelStatistics.fromChannels(self._channels)
+
+    def channel(self, index):
+        """ :param index: номер канала.
+        :return: отсчёты канала без копирования."""
+        return self._channels[index]
+
+    def channelRange(self, index):
+        """ :param index: номер канала.
+        :return: минимальное и максимальное значения канала."""
+        return self.statistics.channelRange(index)
+
+    def close(self):
+        """ Освобождает блок разделяемой памяти. После вызова данные каналов недоступны."""
+        self._channels = None
+        self._shared.close()
+        self._shared.unlink()
+
+
+def expand_paths(patterns):
+    """ Раскрывает шаблоны путей вида captures/*.csv.
+    :param patterns: пути к файлам или шаблоны.
+    :return: отсортированный список путей без повторов."""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+
+def parse_to_shared_memory(file_path, experiment_time):
+    """ Разбирает .csv или .xlsx файл и записывает каналы в новый блок разделяемой памяти.
+    Выполняется в процессе пула.
+    :param file_path: путь к файлу.
+    :param experiment_time: длительность эксперимента, если в файле нет строки со временем.
+    :return: описание блока SharedCaptureInfo."""
+    data = read_table(file_path)
+    if data is None:
+        raise ValueError(f"Неподдерживаемый формат файла {file_path}")
+    data, first_channel, experiment_time = split_time_line(data, experiment_time)
+    channels_number = max(data.shape[1] - first_channel, 0)
+    values_number = data.shape[0]
+    columns = [data.iloc[:, first_channel + index].to_numpy() for index in range(channels_number)]
+    dtypes = [narrow_dtype(values).str for values in columns]
+    offsets, size = channel_offsets(dtypes, values_number)
+
+    shared = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        channels = [np.ndarray((values_number,), dtype=dtype, buffer=shared.buf, offset=offset)
+                    for dtype, offset in zip(dtypes, offsets)]
+        for channel, values in zip(channels, columns):
+            channel[:] = values
+        # Индекс статистики строится здесь, чтобы основной процесс не проходил по отсчётам всех файлов
+        statistics = ChannelStatistics.fromChannels(channels)
+        del channels, columns
+    except BaseException:
+        shared.close()
+        shared.unlink()
+        raise
+    # Блок остаётся в системе до вызова SharedChannels.close() в основном процессе,
+    # поэтому процесс пула не должен удалять его при своём завершении
+    resource_tracker.unregister(shared._name, 'shared_memory')
+    shared.close()
+    return SharedCaptureInfo(file_path=file_path, shared_name=shared.name, channels_number=channels_number,
+                             values_number=values_number, experiment_time=experiment_time, dtypes=dtypes,
+                             statistics=statistics)
+
+
+def release_shared_memory(info):
+    """ Удаляет блок разделяемой памяти, к которому основной процесс так и не подключился.
+    :param info: описание блока SharedCaptureInfo."""
+    try:
+        shared = shared_memory.SharedMemory(name=info.shared_name)
+    except FileNotFoundError:
+        return
+    shared.close()
+    shared.unlink()
+
+
+def load_files(file_paths, experiment_time=10, processes=None):
+    """ Загружает несколько файлов параллельно.
+    Файлы .fgc и столбцовых форматов не разбираются, а открываются в основном процессе.
+    Ошибка загрузки одного файла не прерывает загрузку остальных.
+    :param file_paths: пути к файлам.
+    :param experiment_time: длительность эксперимента для файлов без строки со временем.
+    :param processes: количество процессов пула, по умолчанию -- количество ядер.
+    :return: список источников каналов (SharedChannels, CaptureFile, ArrowChannels или Hdf5Channels)
+             в порядке file_paths, None на месте файлов, которые не удалось загрузить, и словарь вида
+             путь к файлу -- описание ошибки."""
+    sources = [None] * len(file_paths)
+    errors = {}
+    to_parse = []
+    for index, file_path in enumerate(file_paths):
+        file_extension = os.path.splitext(file_path)[1]
+        try:
+            if file_extension == CAPTURE_EXTENSION:
+                sources[index] = CaptureFile(file_path)
+            elif file_extension in COLUMNAR_EXTENSIONS:
+                sources[index] = open_columnar(file_path, experiment_time=experiment_time)
+            else:
+                to_parse.append(index)
+        except Exception as error:
+            errors[file_path] = f"{type(error).__name__}: {error}"
+
+    if to_parse:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {pool.submit(parse_to_shared_memory, file_paths[index], experiment_time): index
+                       for index in to_parse}
+            pending = set(futures)
+            try:
+                # Каждый готовый блок сразу подключается, чтобы при ошибках в других файлах он не остался в системе
+                for future in as_completed(futures):
+                    pending.discard(future)
+                    index = futures[future]
+                    try:
+                        info = future.result()
+                    except Exception as error:
+                        errors[file_paths[index]] = f"{type(error).__name__}: {error}"
+                        continue
+                    try:
+                        sources[index] = SharedChannels(info)
+                    except Exception as error:
+                        release_shared_memory(info)
+                        errors[file_paths[index]] = f"{type(error).__name__}: {error}"
+            except BaseException:
+                # Прерывание загрузки: освобождаются и подключённые, и уже созданные, но не подключённые блоки
+                for future in pending:
+                    future.cancel()
+                for future in pending:
+                    if not future.cancelled() and future.exception() is None:
+                        release_shared_memory(future.result())
+                for source in sources:
+                    if source is not None:
+                        source.close()
+                raise
+    return sources, errors
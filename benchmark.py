@@ -0,0 +1,384 @@
+""" Замеры производительности построения графиков.
+
+Запуск: python benchmark.py [--sizes 1000000 10000000 50000000] [--channels 1]
+Каждый размер замеряется в отдельном процессе, чтобы пиковое потребление памяти
+одного замера не влияло на остальные.
+
+Режим реального времени: python benchmark.py --live [--channels 32] [--seconds 5] [--block-size 4096]
+Проверяет, что Graphic3D.append_samples() принимает не менее LIVE_TARGET_RATE отсчётов в секунду
+(отсчёт -- одно значение всех каналов) при одновременной перерисовке по таймеру.
+
+Набор замеров по этапам: python benchmark.py --suite [--sizes 100000] [--channels 32] [--noise 2]
+    [--time-row] [--repeat 3] [--output results.json] [--compare previous.json]
+Создаёт синтетический .csv файл и отдельно замеряет этапы построения: разбор файла, поиск строки
+со временем, построение вершин, сетку, подписи осей и отрисовку кадров. Отрисовка выполняется
+на платформе Qt offscreen через OpenGL, а если контекст OpenGL создать не удалось -- средствами QPainter,
+как при сохранении изображений (image_export.py); способ отрисовки записывается в render_backend.
+Результаты сохраняются в JSON, --compare выводит отношение времени этапов к результатам предыдущего запуска.
+
+Замер памяти: python benchmark.py --memory [--sizes 10000000] [--channels 4]
+Открывает синтетический .csv файл со всеми отмеченными каналами и выводит, сколько байт памяти, выделенной
+после открытия окна и не освобождённой после загрузки (по tracemalloc, включая массивы numpy), приходится
+на один отсчёт одного канала, а также прирост резидентной памяти процесса."""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+DEFAULT_SIZES = [1_000_000, 10_000_000, 50_000_000]
+LIVE_TARGET_RATE = 1_000_000
+
+
+def generate_samples(values_number, channels, seed=0, noise=2):
+    """ Создаёт синтетическую осциллограмму из целочисленных отсчётов АЦП.
+    :param values_number: количество отсчётов в канале.
+    :param channels: количество каналов.
+    :param seed: зерно генератора случайных чисел.
+    :param noise: амплитуда шума в единицах АЦП.
+    :return: массив формы (отсчёты, каналы)."""
+    rng = np.random.default_rng(seed)
+    offsets = np.arange(channels, dtype=np.int32) * 10 + 20
+    noise = rng.integers(-noise, noise + 1, size=(values_number, channels), dtype=np.int32)
+    return (noise + offsets).astype(np.int32)
+
+
+def write_synthetic_csv(file_path, values_number, channels, noise=2, time_row=None):
+    """ Записывает синтетическую осциллограмму в .csv файл в формате, который читает Graphic3D.
+    :param file_path: путь к создаваемому файлу.
+    :param values_number: количество отсчётов в канале.
+    :param channels: количество каналов.
+    :param noise: амплитуда шума в единицах АЦП.
+    :param time_row: если задано, первой строкой записывается длительность эксперимента."""
+    import pandas as pd
+    with open(file_path, 'w') as file:
+        if time_row is not None:
+            file.write(f"{time_row}" + ";" * (channels - 1) + "\n")
+        pd.DataFrame(generate_samples(values_number, channels, noise=noise)).to_csv(file, sep=';', header=False,
+                                                                                   index=False)
+
+
+def fake_source_blocks(channels, block_size, sample_rate=1_000_000, seed=0):
+    """ Имитирует источник данных АЦП: бесконечно выдаёт блоки синусоид с шумом.
+    Сигнал заранее рассчитывается на один период, поэтому генерация не ограничивает скорость замера.
+    :param channels: количество каналов.
+    :param block_size: количество отсчётов в блоке.
+    :param sample_rate: частота дискретизации, задающая период синусоид.
+    :param seed: зерно генератора случайных чисел.
+    :return: генератор массивов формы (block_size, channels)."""
+    rng = np.random.default_rng(seed)
+    period = max(block_size * 16, sample_rate // 50)
+    phase = np.arange(period, dtype=np.float32)[:, None] * (2 * np.pi / period)
+    offsets = np.arange(channels, dtype=np.float32) * 10 + 20
+    signal = (offsets + 4 * np.sin(phase + offsets / 7) + rng.normal(0, 0.5, (period, channels))).astype(np.float32)
+    signal = np.concatenate([signal, signal[:block_size]])
+    position = 0
+    while True:
+        yield signal[position:position + block_size]
+        position = (position + block_size) % period
+
+
+def peak_rss_mb():
+    """ :return: пиковый размер резидентной памяти текущего процесса в мегабайтах."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb():
+    """ :return: текущий размер резидентной памяти процесса в мегабайтах (пиковый, если текущий недоступен)."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1 << 20)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def measure_memory(values_number, channels):
+    """ Замеряет резидентную память, занятую данными каналов после загрузки файла.
+    :param values_number: количество отсчётов в канале.
+    :param channels: количество каналов.
+    :return: словарь с результатами замера."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    import gc
+    import tracemalloc
+    from PyQt5 import QtWidgets
+    from main import Graphic3D
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "synthetic.csv")
+        write_synthetic_csv(file_path, values_number, channels)
+        gc.collect()
+        rss_before = current_rss_mb()
+        tracemalloc.start()
+        # Файл открывается так же, как из командной строки main.py: с чтением частями в фоновом потоке
+        window = Graphic3D(file_path=file_path, stream_chunk_size=65536)
+        window.stream_loader.wait()
+        app.processEvents()
+        window.wait_until_loaded()
+        gc.collect()
+        allocated, peak_allocated = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_after = current_rss_mb()
+        samples = values_number * channels
+        result = {"samples": values_number, "channels": channels,
+                  "bytes_per_sample": round(allocated / samples, 2),
+                  "peak_bytes_per_sample": round(peak_allocated / samples, 2),
+                  "resident_mb": round(rss_after - rss_before, 1),
+                  "peak_rss_mb": round(peak_rss_mb(), 1)}
+        window.close()
+    return result
+
+
+def measure_first_frame(values_number, channels):
+    """ Замеряет время от начала создания окна до первой отрисовки кадра.
+    :param values_number: количество отсчётов в канале.
+    :param channels: количество каналов.
+    :return: словарь с результатами замера."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets
+    from main import Graphic3D
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    data_array = generate_samples(values_number, channels)
+    rss_before = peak_rss_mb()
+
+    start = time.perf_counter()
+    window = Graphic3D(data_array=data_array)
+    window.wait_until_loaded()
+    window.graphic_widget.repaint()
+    app.processEvents()
+    first_frame = time.perf_counter() - start
+
+    result = {"samples": values_number, "channels": channels,
+              "first_frame_s": round(first_frame, 4),
+              "peak_rss_mb": round(peak_rss_mb(), 1),
+              "input_rss_mb": round(rss_before, 1)}
+    window.close()
+    return result
+
+
+def measure_live_throughput(channels, seconds, block_size):
+    """ Замеряет скорость приёма отсчётов в реальном времени: источник дописывает блоки
+    из отдельного потока, пока цикл событий Qt перерисовывает окно по таймеру.
+    :param channels: количество каналов.
+    :param seconds: длительность замера.
+    :param block_size: количество отсчётов в одном блоке.
+    :return: словарь с результатами замера."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets
+    from main import Graphic3D
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    window = Graphic3D(live_channels=channels)
+    source = fake_source_blocks(channels, block_size)
+    stop = threading.Event()
+
+    def produce():
+        for block in source:
+            if stop.is_set():
+                break
+            window.append_samples(block)
+
+    producer = threading.Thread(target=produce)
+    start = time.perf_counter()
+    producer.start()
+    frames = 0
+    drawn = window.values_number
+    while time.perf_counter() - start < seconds:
+        app.processEvents()
+        if window.values_number != drawn:
+            drawn = window.values_number
+            frames += 1
+        time.sleep(0.001)
+    stop.set()
+    producer.join()
+    elapsed = time.perf_counter() - start
+    rate = window.channels.values_number / elapsed
+    window.close()
+    return {"channels": channels, "block_size": block_size, "seconds": round(elapsed, 2),
+            "samples_per_s": int(rate), "values_per_s": int(rate * channels),
+            "frames_per_s": round(frames / elapsed, 1), "target_samples_per_s": LIVE_TARGET_RATE,
+            "passed": rate >= LIVE_TARGET_RATE}
+
+
+def time_stage(function, repeat, setup=None):
+    """ Замеряет время выполнения этапа.
+    :param function: функция без аргументов.
+    :param repeat: количество повторов.
+    :param setup: функция без аргументов, восстанавливающая исходные данные перед каждым повтором (не замеряется).
+    :return: медианное время в секундах и результат последнего вызова."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return round(float(np.median(timings)), 6), result
+
+
+def measure_stages(values_number, channels, noise, time_row, repeat, frames=10):
+    """ Замеряет этапы построения графика для синтетической осциллограммы.
+    :param values_number: количество отсчётов в канале.
+    :param channels: количество каналов (не больше количества цветов COLORS).
+    :param noise: амплитуда шума в единицах АЦП.
+    :param time_row: если True, первая строка файла содержит длительность эксперимента.
+    :param repeat: количество повторов каждого этапа.
+    :param frames: количество отрисовываемых кадров.
+    :return: словарь с результатами замера."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets
+    from main import COLORS, AxisValuesItem, DecimationPyramid, Graphic3D, GridItem, DataFrameChannels
+    from image_export import render_image
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    channels = min(channels, len(COLORS))
+    stages = {}
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "synthetic.csv")
+        write_synthetic_csv(file_path, values_number, channels, noise, 5 if time_row else None)
+
+        # Этапы Graphic3D вызываются без создания окна
+        state = SimpleNamespace(file_path=file_path, experiment_time=10, line_to_start=0, data=None)
+        stages["parse_file_data"], state.data = time_stage(lambda: Graphic3D.parse_file_data(state), repeat)
+        parsed = state.data
+
+        def reset_state():
+            # first_is_time_line() отделяет строку со временем от state.data, поэтому каждый повтор
+            # начинается с разобранной таблицы
+            state.data = parsed
+            state.line_to_start = 0
+        stages["first_is_time_line"], _ = time_stage(lambda: Graphic3D.first_is_time_line(state), repeat,
+                                                     reset_state)
+        source = DataFrameChannels(state.data, state.line_to_start)
+
+        def build_vertices():
+            return [DecimationPyramid(source.channel(channel)) for channel in range(source.channels_number)]
+        stages["build_vertices"], _ = time_stage(build_vertices, repeat)
+
+        axis_length = 8 * max(values_number, int(np.nanmax(state.data.to_numpy())))
+        grid = GridItem(length=axis_length // 4)
+
+        def set_spacing():
+            # Все масштабы от начального до 1 без кэша вершин
+            grid.geometry_cache.clear()
+            spacing = grid.starting_spacing
+            while spacing >= 1:
+                grid.setSpacing(spacing)
+                spacing //= 2
+        stages["grid_set_spacing"], _ = time_stage(set_spacing, repeat)
+
+        axis_values = AxisValuesItem(axis_length=axis_length, experiment_time=5)
+
+        def set_up_text_items():
+            # Шаг масштаба туда и обратно, как при прокрутке колёсика
+            axis_values.doubleDownTextSpacing()
+            axis_values.doubleUpTextSpacing()
+        stages["axis_set_up_text_items"], _ = time_stage(set_up_text_items, repeat)
+
+        window = Graphic3D(file_path=file_path)
+        window.wait_until_loaded()
+        widget = window.graphic_widget
+        backend = []
+
+        def render():
+            # Без контекста OpenGL кадр рисуется средствами QPainter, как при сохранении изображений
+            for _ in range(frames):
+                backend[:] = [render_image(widget, widget.width(), widget.height())[1]]
+        render_time, _ = time_stage(render, repeat)
+        stages["render_frame"] = round(render_time / frames, 6)
+        window.close()
+
+    return {"samples": values_number, "channels": channels, "noise": noise, "time_row": bool(time_row),
+            "repeat": repeat, "render_backend": backend[0], "stages_s": stages}
+
+
+def git_revision():
+    """ :return: хэш текущего коммита или None, если он недоступен."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(current, previous):
+    """ Сопоставляет время этапов двух запусков с одинаковыми параметрами.
+    :param current: результаты текущего запуска.
+    :param previous: результаты предыдущего запуска.
+    :return: список строк вида "размер этап: было -> стало (отношение)"."""
+    lines = []
+    previous_runs = {(run["samples"], run["channels"]): run for run in previous["runs"]}
+    for run in current["runs"]:
+        old_run = previous_runs.get((run["samples"], run["channels"]))
+        if old_run is None:
+            continue
+        for stage, value in run["stages_s"].items():
+            old_value = old_run["stages_s"].get(stage)
+            if value is None or not old_value:
+                continue
+            lines.append(f"{run['samples']}x{run['channels']} {stage}: {old_value:.6f} -> {value:.6f} "
+                         f"({value / old_value:.2f}x)")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер времени до первого кадра и пиковой памяти.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--channels", type=int, default=1)
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--live", action="store_true", help="замер приёма отсчётов в реальном времени")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--block-size", type=int, default=4096)
+    parser.add_argument("--suite", action="store_true", help="замер этапов построения графика")
+    parser.add_argument("--noise", type=int, default=2)
+    parser.add_argument("--time-row", action="store_true", help="первая строка файла -- длительность эксперимента")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="файл JSON для сохранения результатов --suite")
+    parser.add_argument("--compare", default=None, help="файл JSON с результатами предыдущего запуска --suite")
+    parser.add_argument("--memory", action="store_true", help="замер резидентной памяти на отсчёт после загрузки")
+    args = parser.parse_args()
+
+    if args.suite:
+        sizes = args.sizes if args.sizes != DEFAULT_SIZES else [100_000]
+        results = {"revision": git_revision(), "python": platform.python_version(), "platform": platform.platform(),
+                   "qt_platform": os.environ.get("QT_QPA_PLATFORM", "offscreen"),
+                   "runs": [measure_stages(size, args.channels, args.noise, args.time_row, args.repeat)
+                            for size in sizes]}
+        print(json.dumps(results, indent=2))
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(results, file, indent=2)
+        if args.compare:
+            with open(args.compare) as file:
+                print("\n".join(compare_results(results, json.load(file))))
+        return
+
+    if args.live:
+        channels = args.channels if args.channels > 1 else 32
+        print(json.dumps(measure_live_throughput(channels, args.seconds, args.block_size)))
+        return
+
+    if args.single:
+        measure = measure_memory if args.memory else measure_first_frame
+        print(json.dumps(measure(args.sizes[0], args.channels)))
+        return
+
+    for size in args.sizes:
+        output = subprocess.run([sys.executable, __file__, "--single", "--sizes", str(size),
+                                 "--channels", str(args.channels)] + (["--memory"] if args.memory else []),
+                                capture_output=True, text=True, check=True).stdout
+        print(output.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    main()
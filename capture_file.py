@@ -0,0 +1,259 @@
+""" Компактный столбцовый двоичный формат осциллограмм (.fgc) и конвертер в него.
+
+Структура файла:
+    заголовок фиксированного размера (HEADER_FORMAT): сигнатура, версия, количество каналов,
+    количество отсчётов, тип данных, длительность эксперимента, частота дискретизации;
+    минимумы и максимумы каналов (float64, по два значения на канал);
+    начиная с версии 2 -- индекс статистики каналов (см. channel_statistics.py): размер блока и количество
+    блоков (uint64), количества и суммы отсчётов каналов, минимумы и максимумы блоков (float64);
+    выравнивание до DATA_ALIGNMENT байт;
+    данные каналов, записанные подряд: сначала все отсчёты первого канала, затем второго и т.д.
+
+Запуск конвертера: python capture_file.py input.csv output.fgc [--experiment-time 10] [--dtype int16]"""
+import argparse
+import os
+import struct
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from channel_statistics import ChannelStatistics
+
+CAPTURE_EXTENSION = '.fgc'
+MAGIC = b'FGPCAP\x00\x01'
+VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+# сигнатура, версия, каналы, отсчёты, тип данных, длительность эксперимента, частота дискретизации
+HEADER_FORMAT = '<8sIIQ8sdd'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# размер блока и количество блоков индекса статистики
+STATISTICS_FORMAT = '<QQ'
+STATISTICS_SIZE = struct.calcsize(STATISTICS_FORMAT)
+DATA_ALIGNMENT = 64
+
+
+@dataclass
+class CaptureHeader:
+    channels_number: int
+    values_number: int
+    dtype: str
+    experiment_time: float
+    sample_rate: float
+    channel_min: List[float] = field(default_factory=lambda: [])
+    channel_max: List[float] = field(default_factory=lambda: [])
+    statistics: Optional[ChannelStatistics] = None
+
+    def dataOffset(self):
+        """ :return: смещение начала данных каналов от начала файла в байтах."""
+        size = HEADER_SIZE + 16 * self.channels_number
+        if self.statistics is not None:
+            size += STATISTICS_SIZE + 16 * self.channels_number * (1 + self.statistics.block_min.shape[1])
+        return -(-size // DATA_ALIGNMENT) * DATA_ALIGNMENT
+
+
+class CaptureFile:
+    """ Класс, открывающий файл осциллограммы через np.memmap.
+    Данные канала считываются с диска только при обращении к ним."""
+    def __init__(self, file_path):
+        """ :param file_path: путь к файлу .fgc."""
+        self.file_path = file_path
+        self.header = read_header(file_path)
+        self.experiment_time = self.header.experiment_time
+        self.channels_number = self.header.channels_number
+        self.values_number = self.header.values_number
+        self.statistics = self.header.statistics
+        self.data = np.memmap(file_path, dtype=np.dtype(self.header.dtype), mode='r',
+                              offset=self.header.dataOffset(),
+                              shape=(self.channels_number, self.values_number))
+
+    def channel(self, index):
+        """ :param index: номер канала.
+        :return: отсчёты канала (отображение файла в память, без чтения с диска)."""
+        return self.data[index]
+
+    def channelRange(self, index):
+        """ :param index: номер канала.
+        :return: минимальное и максимальное значения канала из заголовка."""
+        return self.header.channel_min[index], self.header.channel_max[index]
+
+    def close(self):
+        """ Закрывает отображение файла в память. После вызова данные каналов недоступны."""
+        self.data = None
+
+
+def read_header(file_path):
+    """ Читает заголовок файла осциллограммы.
+    :param file_path: путь к файлу .fgc.
+    :return: заголовок CaptureHeader."""
+    with open(file_path, 'rb') as file:
+        magic, version, channels, values, dtype, experiment_time, sample_rate = \
+            struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+        if magic != MAGIC or version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"{file_path} не является файлом осциллограммы версий {SUPPORTED_VERSIONS}")
+        ranges = np.frombuffer(file.read(16 * channels), dtype='<f8').reshape(2, channels)
+        statistics = None
+        if version >= 2:
+            block_size, blocks_number = struct.unpack(STATISTICS_FORMAT, file.read(STATISTICS_SIZE))
+            sums = np.frombuffer(file.read(16 * channels), dtype='<f8').reshape(2, channels)
+            blocks = np.frombuffer(file.read(16 * channels * blocks_number),
+                                   dtype='<f8').reshape(2, channels, blocks_number)
+            statistics = ChannelStatistics(values, block_size, sums[0], sums[1], blocks[0], blocks[1])
+    return CaptureHeader(channels_number=channels, values_number=values,
+                         dtype=dtype.rstrip(b'\x00').decode('ascii'),
+                         experiment_time=experiment_time, sample_rate=sample_rate,
+                         channel_min=ranges[0].tolist(), channel_max=ranges[1].tolist(),
+                         statistics=statistics)
+
+
+def write_capture(file_path, channels, experiment_time, sample_rate=0.0, statistics=None):
+    """ Записывает каналы в файл осциллограммы.
+    :param file_path: путь к создаваемому файлу .fgc.
+    :param channels: массив формы (каналы, отсчёты) или список одномерных массивов одинаковой длины.
+    :param experiment_time: длительность эксперимента в секундах.
+    :param sample_rate: частота дискретизации в герцах, если 0 -- вычисляется по длительности.
+    :param statistics: готовый индекс статистики каналов, если None -- строится по каналам."""
+    if isinstance(channels, list):
+        # Каналы записываются по одному, без объединения в общий массив
+        channels_number = len(channels)
+        values_number = len(channels[0]) if channels else 0
+        dtype = np.result_type(*channels) if channels else np.dtype(np.float32)
+    else:
+        channels = np.ascontiguousarray(channels)
+        channels_number, values_number = channels.shape
+        dtype = channels.dtype
+    if not sample_rate and experiment_time:
+        sample_rate = values_number / float(experiment_time)
+    dtype = dtype.newbyteorder('<')
+    if statistics is None:
+        statistics = ChannelStatistics.fromChannels(channels)
+    header = CaptureHeader(channels_number=channels_number, values_number=values_number,
+                           dtype=dtype.str, experiment_time=float(experiment_time),
+                           sample_rate=float(sample_rate), statistics=statistics)
+
+    with open(file_path, 'wb') as file:
+        file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, channels_number, values_number,
+                               header.dtype.encode('ascii'), header.experiment_time, header.sample_rate))
+        for values in (statistics.minimum, statistics.maximum):
+            file.write(np.asarray(values, dtype='<f8').tobytes())
+        file.write(struct.pack(STATISTICS_FORMAT, statistics.block_size, statistics.block_min.shape[1]))
+        for values in (statistics.count, statistics.total, statistics.block_min, statistics.block_max):
+            file.write(np.asarray(values, dtype='<f8').tobytes())
+        file.write(b'\x00' * (header.dataOffset() - file.tell()))
+        for values in channels:
+            np.asarray(values).astype(dtype, copy=False).tofile(file)
+
+
+def read_table(file_path):
+    """ Читает таблицу отсчётов из .csv (разделитель ';') или .xlsx файла.
+    :param file_path: путь к файлу.
+    :return: датафрейм, в котором каждый столбец -- канал."""
+    _, file_extension = os.path.splitext(file_path)
+    data = None
+    if file_extension == '.csv':
+        data = pd.read_csv(filepath_or_buffer=file_path, sep=';', header=None)
+    elif file_extension == '.xlsx':
+        data = pd.read_excel(io=file_path)
+    return data
+
+
+def find_time_line(data):
+    """ Проверяет, содержит ли первая строка таблицы только время эксперимента.
+    :param data: датафрейм с отсчётами.
+    :return: время эксперимента, если первая строка содержит только одно число, иначе None."""
+    first_line_list = data.iloc[0].tolist()
+    for item in first_line_list[1::]:
+        if not np.isnan(item):
+            return None
+    return first_line_list[0]
+
+
+def split_time_line(data, experiment_time):
+    """ Отделяет от таблицы первую строку, если она содержит только время эксперимента. Такая строка
+    не является отсчётом, а её первый столбец (время) не является каналом.
+    :param data: датафрейм с отсчётами.
+    :param experiment_time: длительность эксперимента, если строки со временем нет.
+    :return: датафрейм без строки со временем, номер столбца, с которого начинаются каналы,
+             и длительность эксперимента."""
+    time = find_time_line(data)
+    if time is None:
+        return data, 0, experiment_time
+    return data.iloc[1:], 1, time
+
+
+def narrow_dtype(values):
+    """ Подбирает самый узкий тип данных, в котором отсчёты хранятся без потерь.
+    Целые отсчёты (в том числе записанные как числа с плавающей точкой без пропусков) хранятся
+    в int16 или int32, остальные -- в float32.
+    :param values: одномерный массив отсчётов.
+    :return: тип данных numpy."""
+    values = np.asarray(values)
+    if not len(values):
+        return np.dtype(np.float32)
+    if np.issubdtype(values.dtype, np.floating):
+        if np.isnan(values).any() or not np.array_equal(values, np.round(values)):
+            return np.dtype(np.float32)
+    elif not np.issubdtype(values.dtype, np.integer) and values.dtype != np.bool_:
+        return np.dtype(np.float32)
+    minimum, maximum = values.min(), values.max()
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= minimum and maximum <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.float32) if np.issubdtype(values.dtype, np.floating) else np.dtype(np.int64)
+
+
+def common_dtype(first, second):
+    """ Подбирает тип данных, в котором без потерь хранятся отсчёты обоих типов, по тем же правилам,
+    что и narrow_dtype(): целые остаются целыми, иначе -- float32.
+    :param first: тип данных уже записанных отсчётов.
+    :param second: тип данных новых отсчётов.
+    :return: тип данных numpy."""
+    first, second = np.dtype(first), np.dtype(second)
+    if np.issubdtype(first, np.integer) and np.issubdtype(second, np.integer):
+        return np.promote_types(first, second)
+    return np.dtype(np.float32)
+
+
+def compact_channels(data, first_channel=0):
+    """ Переводит столбцы таблицы в отдельные массивы каналов самого узкого подходящего типа данных.
+    :param data: датафрейм, в котором каждый столбец -- канал.
+    :param first_channel: номер столбца, с которого начинаются каналы.
+    :return: список одномерных массивов каналов."""
+    channels = []
+    for index in range(first_channel, data.shape[1]):
+        values = data.iloc[:, index].to_numpy()
+        channels.append(np.ascontiguousarray(values, dtype=narrow_dtype(values)))
+    return channels
+
+
+def convert_to_capture(input_path, output_path, experiment_time=10, dtype=None):
+    """ Преобразует .csv или .xlsx файл в файл осциллограммы.
+    Каналы сохраняются в том же виде, в котором их отображает Graphic3D.
+    :param input_path: путь к исходному файлу.
+    :param output_path: путь к создаваемому файлу .fgc.
+    :param experiment_time: длительность эксперимента, если в файле нет строки со временем.
+    :param dtype: тип данных каналов в файле, по умолчанию -- самый узкий тип, в котором каналы хранятся без потерь."""
+    data = read_table(input_path)
+    if data is None:
+        raise ValueError(f"Неподдерживаемый формат файла {input_path}")
+    data, first_channel, experiment_time = split_time_line(data, experiment_time)
+    channels = compact_channels(data, first_channel)
+    if dtype is not None:
+        channels = [values.astype(dtype) for values in channels]
+    write_capture(output_path, channels, experiment_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Конвертер .csv/.xlsx в двоичный формат осциллограмм .fgc.")
+    parser.add_argument("input_path")
+    parser.add_argument("output_path")
+    parser.add_argument("--experiment-time", type=float, default=10)
+    parser.add_argument("--dtype", default=None, help="например int16, int32, float32")
+    args = parser.parse_args()
+    convert_to_capture(args.input_path, args.output_path, args.experiment_time, args.dtype)
+
+
+if __name__ == '__main__':
+    main()
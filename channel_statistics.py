@@ -0,0 +1,144 @@
+""" Индекс статистики каналов: количество, минимум, максимум и среднее каждого канала,
+а также минимумы и максимумы блоков фиксированного размера.
+
+Индекс строится за один векторизованный проход по каждому каналу, после чего размеры осей,
+положение камеры и масштаб по данным для любого диапазона отсчётов вычисляются по блокам,
+без обращения к самим отсчётам."""
+import numpy as np
+
+DEFAULT_BLOCK_SIZE = 4096
+
+
+class ChannelStatistics:
+    """ Класс индекса статистики каналов одинаковой длины."""
+    def __init__(self, values_number, block_size, count, total, block_min, block_max, indexed=None):
+        """ :param values_number: количество отсчётов в каждом канале.
+        :param block_size: количество отсчётов в блоке.
+        :param count: количество отсчётов каждого канала, не равных NaN.
+        :param total: сумма отсчётов каждого канала.
+        :param block_min: минимумы блоков формы (каналы, блоки).
+        :param block_max: максимумы блоков формы (каналы, блоки).
+        :param indexed: признаки каналов, уже учтённых в индексе, если None -- учтены все каналы."""
+        self.values_number = values_number
+        self.block_size = block_size
+        self.count = np.asarray(count, dtype=np.float64)
+        self.total = np.asarray(total, dtype=np.float64)
+        self.block_min = np.asarray(block_min, dtype=np.float64)
+        self.block_max = np.asarray(block_max, dtype=np.float64)
+        blocks_number = self.block_min.shape[1]
+        self.minimum = np.fmin.reduce(self.block_min, axis=1) if blocks_number else np.zeros(len(self.count))
+        self.maximum = np.fmax.reduce(self.block_max, axis=1) if blocks_number else np.zeros(len(self.count))
+        self.indexed = np.ones(len(self.count), dtype=bool) if indexed is None else np.asarray(indexed, dtype=bool)
+
+    @classmethod
+    def fromChannels(cls, channels, block_size=DEFAULT_BLOCK_SIZE):
+        """ Строит индекс по отсчётам каналов.
+        :param channels: последовательность одномерных массивов отсчётов одинаковой длины.
+        :param block_size: количество отсчётов в блоке.
+        :return: индекс ChannelStatistics."""
+        counts, totals, block_mins, block_maxs = [], [], [], []
+        values_number = 0
+        for values in channels:
+            values = np.asarray(values)
+            values_number = len(values)
+            full_blocks = values_number // block_size
+            parts = [values[:full_blocks * block_size].reshape(full_blocks, block_size)]
+            if values_number % block_size:
+                parts.append(values[full_blocks * block_size:].reshape(1, -1))
+            block_mins.append(np.concatenate([np.fmin.reduce(part, axis=1) for part in parts]))
+            block_maxs.append(np.concatenate([np.fmax.reduce(part, axis=1) for part in parts]))
+            if np.issubdtype(values.dtype, np.floating):
+                counts.append(values_number - np.count_nonzero(np.isnan(values)))
+                totals.append(np.nansum(values, dtype=np.float64))
+            else:
+                counts.append(values_number)
+                totals.append(np.sum(values, dtype=np.float64))
+        blocks_number = -(-values_number // block_size)
+        shape = (len(counts), blocks_number)
+        return cls(values_number, block_size, counts, totals,
+                   np.array(block_mins, dtype=np.float64).reshape(shape),
+                   np.array(block_maxs, dtype=np.float64).reshape(shape))
+
+    @classmethod
+    def empty(cls, channels_number, values_number, block_size=DEFAULT_BLOCK_SIZE):
+        """ Создаёт индекс, в котором ещё не учтён ни один канал: блоки заполнены NaN.
+        Используется источниками, каналы которых читаются по одному, каналы учитываются методом setChannel().
+        :param channels_number: количество каналов.
+        :param values_number: количество отсчётов в каждом канале.
+        :param block_size: количество отсчётов в блоке.
+        :return: индекс ChannelStatistics."""
+        blocks = np.full((channels_number, -(-values_number // block_size)), np.nan)
+        return cls(values_number, block_size, np.zeros(channels_number), np.zeros(channels_number), blocks,
+                   blocks.copy(), indexed=np.zeros(channels_number, dtype=bool))
+
+    @classmethod
+    def fromSource(cls, source, block_size=DEFAULT_BLOCK_SIZE):
+        """ Строит индекс по всем каналам источника (DataFrameChannels, SharedChannels и т.п.).
+        :param source: источник каналов.
+        :param block_size: количество отсчётов в блоке.
+        :return: индекс ChannelStatistics."""
+        return cls.fromChannels((source.channel(index) for index in range(source.channels_number)), block_size)
+
+    @classmethod
+    def combine(cls, statistics):
+        """ Объединяет индексы нескольких источников, каналы более коротких источников дополняются пустыми блоками.
+        :param statistics: индексы ChannelStatistics с одинаковым размером блока.
+        :return: индекс всех каналов подряд или None, если индексы несовместимы."""
+        if not statistics or any(item is None or item.block_size != statistics[0].block_size for item in statistics):
+            return None
+        blocks_number = max(item.block_min.shape[1] for item in statistics)
+
+        def padded(blocks):
+            return np.pad(blocks, ((0, 0), (0, blocks_number - blocks.shape[1])), constant_values=np.nan)
+
+        return cls(max(item.values_number for item in statistics), statistics[0].block_size,
+                   np.concatenate([item.count for item in statistics]),
+                   np.concatenate([item.total for item in statistics]),
+                   np.concatenate([padded(item.block_min) for item in statistics]),
+                   np.concatenate([padded(item.block_max) for item in statistics]),
+                   np.concatenate([item.indexed for item in statistics]))
+
+    def setChannel(self, index, values):
+        """ Учитывает в индексе отсчёты канала, прочитанного после построения индекса.
+        :param index: номер канала.
+        :param values: отсчёты канала."""
+        channel = ChannelStatistics.fromChannels([values], self.block_size)
+        blocks_number = min(channel.block_min.shape[1], self.block_min.shape[1])
+        self.count[index] = channel.count[0]
+        self.total[index] = channel.total[0]
+        self.block_min[index, :blocks_number] = channel.block_min[0, :blocks_number]
+        self.block_max[index, :blocks_number] = channel.block_max[0, :blocks_number]
+        self.minimum[index] = channel.minimum[0]
+        self.maximum[index] = channel.maximum[0]
+        self.indexed[index] = True
+
+    @property
+    def mean(self):
+        """ :return: среднее значение каждого канала."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.total / self.count
+
+    def channelRange(self, index):
+        """ :param index: номер канала.
+        :return: минимальное и максимальное значения канала."""
+        return self.minimum[index], self.maximum[index]
+
+    def rangeMinMax(self, first, last, channels=None):
+        """ Оценивает минимум и максимум каналов на диапазоне отсчётов по блокам, в которые он попадает.
+        Крайние блоки учитываются целиком, поэтому оценка не уже действительного диапазона значений.
+        :param first: первый номер отсчёта.
+        :param last: последний номер отсчёта.
+        :param channels: номера каналов, если None -- все каналы.
+        :return: минимум и максимум или None, если в диапазон не попал ни один отсчёт."""
+        first_block = max(int(np.floor(first / self.block_size)), 0)
+        last_block = min(int(np.floor(last / self.block_size)) + 1, self.block_min.shape[1])
+        if channels is None:
+            channels = range(len(self.count))
+        channels = list(channels)
+        if first_block >= last_block or not channels:
+            return None
+        minimum = np.fmin.reduce(self.block_min[channels, first_block:last_block], axis=None)
+        maximum = np.fmax.reduce(self.block_max[channels, first_block:last_block], axis=None)
+        if np.isnan(minimum) or np.isnan(maximum):
+            return None
+        return minimum, maximum
@@ -0,0 +1,264 @@
+""" Чтение осциллограмм из столбцовых форматов: Apache Parquet, Feather (Arrow IPC) и HDF5.
+
+Каналы читаются по одному при первом обращении к ним (чтение только нужных столбцов), а при заданном
+диапазоне строк -- только отсчёты из этого диапазона. Индекс статистики (см. channel_statistics.py) дополняется
+каждым каналом при первом чтении, поэтому размеры осей и масштаб по данным не требуют повторного чтения.
+
+Parquet и Feather: каждый числовой столбец -- канал. Длительность эксперимента может храниться
+в метаданных схемы под ключом experiment_time.
+HDF5: каналы -- столбцы двумерного набора данных формы (отсчёты, каналы) или одномерные наборы данных
+группы. Длительность эксперимента может храниться в атрибуте experiment_time набора данных, группы или файла."""
+import os
+
+import numpy as np
+
+from channel_statistics import ChannelStatistics
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_imported = True
+except ModuleNotFoundError:
+    arrow_imported = False
+
+try:
+    import h5py
+
+    h5py_imported = True
+except ModuleNotFoundError:
+    h5py_imported = False
+
+ARROW_EXTENSIONS = ('.parquet', '.feather', '.arrow')
+HDF5_EXTENSIONS = ('.h5', '.hdf5')
+COLUMNAR_EXTENSIONS = ARROW_EXTENSIONS + HDF5_EXTENSIONS
+EXPERIMENT_TIME_KEY = 'experiment_time'
+
+
+def row_range(rows, total):
+    """ Приводит диапазон строк к границам таблицы.
+    :param rows: пара (первая строка, строка после последней), None в любой позиции -- граница таблицы.
+    :param total: количество строк в таблице.
+    :return: первая строка и строка после последней."""
+    first, last = rows if rows is not None else (None, None)
+    first = 0 if first is None else min(max(int(first), 0), total)
+    last = total if last is None else min(max(int(last), first), total)
+    return first, last
+
+
+def slice_experiment_time(experiment_time, first, last, total):
+    """ :return: длительность части эксперимента, соответствующей строкам [first, last) из total."""
+    if not total:
+        return experiment_time
+    return experiment_time * (last - first) / total
+
+
+class ArrowChannels:
+    """ Класс каналов файла Parquet или Feather.
+    Предоставляет каналы в том же виде, что и CaptureFile."""
+    def __init__(self, file_path, rows=None, experiment_time=10):
+        """ :param file_path: путь к файлу .parquet, .feather или .arrow.
+        :param rows: диапазон строк (первая, после последней), если None -- все строки.
+        :param experiment_time: длительность эксперимента, если её нет в метаданных файла."""
+        if not arrow_imported:
+            raise ModuleNotFoundError("Для чтения Parquet и Feather файлов необходим пакет pyarrow")
+        self.file_path = file_path
+        self._parquet = None
+        self._batch_lengths = []    # длины первых пакетов записей Feather, известные по прочитанным пакетам
+        if os.path.splitext(file_path)[1] == '.parquet':
+            self._parquet = pq.ParquetFile(file_path)
+            schema = self._parquet.schema_arrow
+            total = self._parquet.metadata.num_rows
+        else:
+            # Файл отображается в память, количество строк считается по заголовкам пакетов записей без чтения столбцов
+            with pa.memory_map(file_path) as source:
+                reader = pa.ipc.open_file(source)
+                schema = reader.schema
+                total = reader.count_rows()
+        self._schema = schema
+        self._columns = [field.name for field in schema
+                         if pa.types.is_integer(field.type) or pa.types.is_floating(field.type)]
+        metadata = schema.metadata or {}
+        if EXPERIMENT_TIME_KEY.encode() in metadata:
+            experiment_time = float(metadata[EXPERIMENT_TIME_KEY.encode()])
+        self.first_row, self.last_row = row_range(rows, total)
+        self.total_values_number = total
+        self.experiment_time = slice_experiment_time(experiment_time, self.first_row, self.last_row, total)
+        self.channels_number = len(self._columns)
+        self.values_number = self.last_row - self.first_row
+        self.statistics = ChannelStatistics.empty(self.channels_number, self.values_number)
+        # Диапазоны значений всего файла Parquet известны из статистики групп строк без чтения отсчётов
+        for index in range(self.channels_number):
+            row_groups_range = self._rowGroupsRange(index)
+            if row_groups_range is not None:
+                self.statistics.minimum[index], self.statistics.maximum[index] = row_groups_range
+
+    def _rowGroupsRange(self, index):
+        """ :param index: номер канала.
+        :return: минимальное и максимальное значения канала по статистике групп строк Parquet или None,
+                 если файл не Parquet, задан диапазон строк или статистики нет."""
+        if self._parquet is None or self.values_number != self.total_values_number:
+            return None
+        metadata = self._parquet.metadata
+        column_index = self._parquet.schema_arrow.get_field_index(self._columns[index])
+        statistics = [metadata.row_group(group).column(column_index).statistics
+                      for group in range(metadata.num_row_groups)]
+        if statistics and all(item is not None and item.has_min_max for item in statistics):
+            return min(item.min for item in statistics), max(item.max for item in statistics)
+        return None
+
+    def _rowGroups(self):
+        """ :return: номера групп строк Parquet, пересекающихся с диапазоном строк, и номер первой строки первой из них."""
+        metadata = self._parquet.metadata
+        groups = []
+        groups_start = None
+        start = 0
+        for group in range(metadata.num_row_groups):
+            end = start + metadata.row_group(group).num_rows
+            if start < self.last_row and end > self.first_row:
+                groups.append(group)
+                if groups_start is None:
+                    groups_start = start
+            start = end
+        return groups, groups_start or 0
+
+    def _featherChannel(self, name):
+        """ Читает отсчёты столбца Feather только из пакетов записей, пересекающихся с диапазоном строк.
+        Длины пакетов запоминаются, поэтому пакеты перед диапазоном строк читаются только при первом обращении.
+        :param name: название столбца.
+        :return: отсчёты столбца в диапазоне строк."""
+        field = self._schema.get_field_index(name)
+        lengths = list(self._batch_lengths)
+        chunks = []
+        with pa.memory_map(self.file_path) as source:
+            # Из каждого пакета разбираются и распаковываются только буферы запрошенного столбца
+            reader = pa.ipc.open_file(source, options=pa.ipc.IpcReadOptions(included_fields=[field]))
+            start = 0
+            for batch_index in range(reader.num_record_batches):
+                if start >= self.last_row:
+                    break
+                if batch_index < len(lengths) and start + lengths[batch_index] <= self.first_row:
+                    start += lengths[batch_index]
+                    continue
+                column = reader.get_batch(batch_index).column(0)
+                if batch_index == len(lengths):
+                    lengths.append(len(column))
+                first = max(self.first_row - start, 0)
+                last = min(self.last_row - start, len(column))
+                if last > first:
+                    chunks.append(column.slice(first, last - first))
+                start += len(column)
+            values = pa.chunked_array(chunks, type=self._schema.field(field).type).to_numpy()
+        if len(lengths) > len(self._batch_lengths):
+            self._batch_lengths = lengths
+        return values
+
+    def channel(self, index):
+        """ Читает отсчёты канала в диапазоне строк. При первом чтении канал учитывается в индексе статистики.
+        :param index: номер канала.
+        :return: отсчёты канала, пропущенные значения заменены на NaN."""
+        values = self._readChannel(index)
+        if not self.statistics.indexed[index]:
+            self.statistics.setChannel(index, values)
+        return values
+
+    def _readChannel(self, index):
+        """ :param index: номер канала.
+        :return: отсчёты канала в диапазоне строк."""
+        name = self._columns[index]
+        if self._parquet is not None:
+            # Читаются только группы строк, попадающие в диапазон
+            groups, groups_start = self._rowGroups()
+            column = self._parquet.read_row_groups(groups, columns=[name]).column(0)
+            column = column.slice(self.first_row - groups_start, self.values_number)
+            return np.asarray(column.to_numpy())
+        return np.asarray(self._featherChannel(name))
+
+    def channelRange(self, index):
+        """ :param index: номер канала.
+        :return: минимальное и максимальное значения канала. Для всего файла Parquet берутся
+                 из статистики групп строк без чтения отсчётов, для остальных канал читается один раз."""
+        if not self.statistics.indexed[index]:
+            row_groups_range = self._rowGroupsRange(index)
+            if row_groups_range is not None:
+                return row_groups_range
+            self.channel(index)
+        return self.statistics.channelRange(index)
+
+    def close(self):
+        """ Закрывает файл."""
+        self._parquet = None
+
+
+class Hdf5Channels:
+    """ Класс каналов файла HDF5.
+    Предоставляет каналы в том же виде, что и CaptureFile."""
+    def __init__(self, file_path, rows=None, experiment_time=10, dataset=None):
+        """ :param file_path: путь к файлу .h5 или .hdf5.
+        :param rows: диапазон строк (первая, после последней), если None -- все строки.
+        :param experiment_time: длительность эксперимента, если её нет в атрибутах файла.
+        :param dataset: путь к набору данных или группе внутри файла, если None -- единственный объект
+                        в корне файла или сам корень."""
+        if not h5py_imported:
+            raise ModuleNotFoundError("Для чтения HDF5 файлов необходим пакет h5py")
+        self.file_path = file_path
+        self._file = h5py.File(file_path, 'r')
+        node = self._file[dataset] if dataset is not None else self._file
+        if dataset is None and len(node) == 1:
+            node = next(iter(node.values()))
+
+        # Для каждого канала -- набор данных и номер столбца в нём (None для одномерного набора)
+        if isinstance(node, h5py.Dataset):
+            if node.ndim == 1:
+                self._columns = [(node, None)]
+            else:
+                self._columns = [(node, column) for column in range(node.shape[1])]
+        else:
+            self._columns = [(item, None) for item in node.values()
+                             if isinstance(item, h5py.Dataset) and item.ndim == 1]
+        total = min((item.shape[0] for item, _ in self._columns), default=0)
+
+        for attributes in (node.attrs, self._file.attrs):
+            if EXPERIMENT_TIME_KEY in attributes:
+                experiment_time = float(attributes[EXPERIMENT_TIME_KEY])
+                break
+        self.first_row, self.last_row = row_range(rows, total)
+        self.experiment_time = slice_experiment_time(experiment_time, self.first_row, self.last_row, total)
+        self.channels_number = len(self._columns)
+        self.values_number = self.last_row - self.first_row
+        self.statistics = ChannelStatistics.empty(self.channels_number, self.values_number)
+
+    def channel(self, index):
+        """ Читает отсчёты канала в диапазоне строк. При первом чтении канал учитывается в индексе статистики.
+        :param index: номер канала.
+        :return: отсчёты канала."""
+        dataset, column = self._columns[index]
+        if column is None:
+            values = dataset[self.first_row:self.last_row]
+        else:
+            values = dataset[self.first_row:self.last_row, column]
+        if not self.statistics.indexed[index]:
+            self.statistics.setChannel(index, values)
+        return values
+
+    def channelRange(self, index):
+        """ :param index: номер канала.
+        :return: минимальное и максимальное значения канала, канал читается один раз."""
+        if not self.statistics.indexed[index]:
+            self.channel(index)
+        return self.statistics.channelRange(index)
+
+    def close(self):
+        """ Закрывает файл. После вызова данные каналов недоступны."""
+        self._file.close()
+
+
+def open_columnar(file_path, rows=None, experiment_time=10):
+    """ Открывает файл столбцового формата.
+    :param file_path: путь к файлу .parquet, .feather, .arrow, .h5 или .hdf5.
+    :param rows: диапазон строк (первая, после последней), если None -- все строки.
+    :param experiment_time: длительность эксперимента, если её нет в метаданных файла.
+    :return: источник каналов ArrowChannels или Hdf5Channels."""
+    if os.path.splitext(file_path)[1] in HDF5_EXTENSIONS:
+        return Hdf5Channels(file_path, rows, experiment_time)
+    return ArrowChannels(file_path, rows, experiment_time)
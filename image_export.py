@@ -0,0 +1,229 @@
+""" Сохранение графиков осциллограмм в изображения без вывода окон на экран.
+
+Запуск: python image_export.py captures/*.csv --output-dir images [--size 1920 1080] [--channels 0 3]
+    [--processes 8] [--autoscale] [--rows FIRST LAST] [--experiment-time 10]
+Каждый файл открывается в Graphic3D с теми же осями, сеткой и положением камеры, что и в интерактивном
+режиме, отрисовывается в изображение заданного размера и сохраняется в PNG. Файлы обрабатываются
+параллельно в пуле процессов на платформе Qt offscreen (если не задана QT_QPA_PLATFORM). Платформа offscreen
+в Qt 5 создаёт контекст OpenGL только через GLX, поэтому на сервере без X и GPU сцена рисуется средствами
+QPainter по тем же вершинам, сетке и подписям, что и в OpenGL."""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from batch_loader import expand_paths
+
+DEFAULT_SIZE = (1920, 1080)
+IMAGE_EXTENSION = '.png'
+
+
+def output_paths(file_paths, output_directory):
+    """ Составляет пути изображений по именам исходных файлов, к повторяющимся именам добавляется номер.
+    :param file_paths: пути к исходным файлам.
+    :param output_directory: каталог изображений.
+    :return: пути изображений в порядке file_paths."""
+    used = {}
+    paths = []
+    for file_path in file_paths:
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        used[name] = used.get(name, 0) + 1
+        if used[name] > 1:
+            name = f"{name}_{used[name]}"
+        paths.append(os.path.join(output_directory, name + IMAGE_EXTENSION))
+    return paths
+
+
+def project_points(matrix, points, width, height):
+    """ Переводит точки графика в пиксели изображения.
+    :param matrix: матрица QMatrix4x4 вида проекция * вид.
+    :param points: точки формы (n, 3).
+    :return: координаты x и y точек в пикселях."""
+    matrix = np.array(matrix.data(), dtype=np.float64).reshape(4, 4).T
+    points = np.asarray(points, dtype=np.float64)
+    clip = points @ matrix[:, :3].T + matrix[:, 3]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = (clip[:, 0] / clip[:, 3] + 1) * (width / 2)
+        y = (1 - clip[:, 1] / clip[:, 3]) * (height / 2)
+    return x, y
+
+
+def segments_path(x, y, width, height):
+    """ Строит путь из отрезков (пар точек), отбрасывая отрезки, целиком лежащие за одной из сторон изображения.
+    :return: путь QPainterPath."""
+    from pyqtgraph import arrayToQPath
+
+    x = x[:len(x) // 2 * 2].reshape(-1, 2)
+    y = y[:len(y) // 2 * 2].reshape(-1, 2)
+    inside = ~((x.max(axis=1) < 0) | (x.min(axis=1) > width) | (y.max(axis=1) < 0) | (y.min(axis=1) > height))
+    return arrayToQPath(x[inside].ravel(), y[inside].ravel(), connect='pairs')
+
+
+def paint_scene(widget, width, height):
+    """ Рисует содержимое графика средствами QPainter без OpenGL: линии (в том числе каналы PackedLinesItem)
+    и подписи проецируются той же матрицей камеры, что и при отрисовке в OpenGL.
+    :param widget: виджет графика MyGLViewWidget.
+    :param width: ширина изображения в пикселях.
+    :param height: высота изображения в пикселях.
+    :return: изображение QImage."""
+    from PyQt5 import QtCore, QtGui
+    from pyqtgraph.opengl import GLLinePlotItem, GLTextItem
+
+    from main import PackedLinesItem
+
+    viewport = (0, 0, width, height)
+    camera = widget.projectionMatrix(viewport, viewport) * widget.viewMatrix()
+    image = QtGui.QImage(width, height, QtGui.QImage.Format.Format_ARGB32)
+    image.fill(QtGui.QColor.fromRgbF(*widget.opts['bgcolor']))
+    painter = QtGui.QPainter(image)
+    for item in widget.items:
+        if not item.visible():
+            continue
+        matrix = camera * item.transform()
+        if isinstance(item, GLTextItem):
+            if item.text:
+                x, y = project_points(matrix, [item.pos], width, height)
+                painter.setPen(item.color)
+                painter.setFont(item.font)
+                painter.drawText(item.align_text(QtCore.QPointF(x[0], y[0])), item.text)
+            continue
+        if not isinstance(item, GLLinePlotItem) or item.pos is None or not len(item.pos):
+            continue
+        if isinstance(item, PackedLinesItem):
+            parts = [(item.pos[offset:offset + count], color)
+                     for (offset, count), color, visible in zip(item.channel_ranges, item.channel_colors,
+                                                                item.channel_visible) if visible and count]
+        else:
+            color = item.color[0] if isinstance(item.color, np.ndarray) else item.color
+            parts = [(item.pos, color)]
+        for vertices, color in parts:
+            x, y = project_points(matrix, vertices, width, height)
+            if item.mode == 'line_strip':
+                x, y = np.repeat(x, 2)[1:-1], np.repeat(y, 2)[1:-1]
+            pen = QtGui.QPen(QtGui.QColor.fromRgbF(*color))
+            pen.setWidthF(item.width)
+            pen.setCosmetic(True)
+            painter.strokePath(segments_path(x, y, width, height), pen)
+    painter.end()
+    return image
+
+
+def render_image(widget, width, height):
+    """ Отрисовывает график во внеэкранный буфер OpenGL, а если контекст OpenGL создать не удалось
+    (например, на сервере без X и драйвера GPU) -- средствами QPainter через paint_scene().
+    :param widget: виджет графика MyGLViewWidget.
+    :param width: ширина изображения в пикселях.
+    :param height: высота изображения в пикселях.
+    :return: изображение QImage и способ отрисовки ('opengl' или 'qpainter')."""
+    from PyQt5 import QtGui
+
+    context = widget.context()
+    if context is None or not context.isValid():
+        return paint_scene(widget, width, height), 'qpainter'
+    # Пиксели в порядке байт BGRA, что совпадает с Format_ARGB32 на little-endian машинах
+    pixels = widget.renderToArray((width, height))
+    image = QtGui.QImage(pixels.data, width, height, width * 4, QtGui.QImage.Format.Format_ARGB32)
+    return image.copy(), 'opengl'
+
+
+def export_file(file_path, output_path, size=DEFAULT_SIZE, checked_channels=None, experiment_time=10, rows=None,
+                autoscale=False):
+    """ Сохраняет график одного файла в изображение. Окно графика на экран не выводится.
+    :param file_path: путь к файлу осциллограммы.
+    :param output_path: путь к сохраняемому изображению.
+    :param size: ширина и высота изображения в пикселях.
+    :param checked_channels: номера отображаемых каналов (с 0), если None -- все каналы.
+    :param experiment_time: длительность эксперимента для файлов без строки со временем.
+    :param rows: диапазон строк (первая, после последней) для Parquet, Feather и HDF5 файлов.
+    :param autoscale: если True, график масштабируется по значениям отображаемых каналов,
+                      как кнопкой 'Масштаб по данным'.
+    :return: путь к сохранённому изображению."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets
+    from main import Graphic3D
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    width, height = size
+    window = Graphic3D(file_path=file_path, experiment_time=experiment_time, checked_channels=checked_channels,
+                       rows=rows, offscreen=True)
+    try:
+        window.wait_until_loaded()
+        if window.progress_bar.format().startswith("Ошибка"):
+            raise RuntimeError(window.progress_bar.format())
+        widget = window.graphic_widget
+        if widget is None:
+            raise RuntimeError(f"Не удалось построить график файла {file_path}")
+        # Видимая область и уровни детализации определяются по размеру виджета, поэтому он совпадает с изображением
+        widget.setFixedSize(width, height)
+        app.processEvents()
+        widget.viewChanged()
+        if autoscale:
+            window.autoscale()
+        image, _ = render_image(widget, width, height)
+        if not image.save(output_path):
+            raise OSError(f"Не удалось сохранить изображение {output_path}")
+    finally:
+        window.close()
+        window.deleteLater()
+        app.processEvents()
+    return output_path
+
+
+def export_task(file_path, output_path, options):
+    """ Выполняет export_file() в процессе пула.
+    :return: пара (путь к изображению, None) или (None, описание ошибки)."""
+    try:
+        return export_file(file_path, output_path, **options), None
+    except Exception as error:
+        return None, f"{type(error).__name__}: {error}"
+
+
+def export_files(file_paths, output_directory, processes=None, **options):
+    """ Сохраняет графики нескольких файлов в изображения параллельно.
+    :param file_paths: пути к файлам осциллограмм.
+    :param output_directory: каталог изображений, создаётся при необходимости.
+    :param processes: количество процессов пула, по умолчанию -- количество ядер.
+    :param options: параметры export_file() (size, checked_channels, experiment_time, rows, autoscale).
+    :return: список пар (путь к изображению, описание ошибки или None) в порядке file_paths."""
+    os.makedirs(output_directory, exist_ok=True)
+    images = output_paths(file_paths, output_directory)
+    if processes == 1:
+        return [export_task(file_path, image, options) for file_path, image in zip(file_paths, images)]
+    # Qt плохо переносит fork, поэтому процессы пула запускаются заново и создают собственное приложение Qt
+    with ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn')) as pool:
+        return list(pool.map(export_task, file_paths, images, [options] * len(file_paths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сохранение графиков осциллограмм в PNG без вывода окон.")
+    parser.add_argument("paths", nargs="+", metavar="PATH", help="файлы или шаблоны вида captures/*.csv")
+    parser.add_argument("--output-dir", required=True, help="каталог изображений")
+    parser.add_argument("--size", nargs=2, type=int, metavar=("WIDTH", "HEIGHT"), default=DEFAULT_SIZE)
+    parser.add_argument("--channels", nargs="+", type=int, default=None,
+                        help="номера отображаемых каналов (с 0), по умолчанию -- все")
+    parser.add_argument("--processes", type=int, default=None, help="количество процессов, по умолчанию -- ядер")
+    parser.add_argument("--autoscale", action="store_true", help="масштабировать по значениям каналов")
+    parser.add_argument("--rows", nargs=2, type=int, metavar=("FIRST", "LAST"), default=None,
+                        help="диапазон строк для Parquet, Feather и HDF5 файлов")
+    parser.add_argument("--experiment-time", type=float, default=10)
+    args = parser.parse_args()
+
+    file_paths = expand_paths(args.paths)
+    results = export_files(file_paths, args.output_dir, args.processes, size=tuple(args.size),
+                           checked_channels=args.channels, experiment_time=args.experiment_time, rows=args.rows,
+                           autoscale=args.autoscale)
+    failed = 0
+    for file_path, (image, error) in zip(file_paths, results):
+        if error is not None:
+            failed += 1
+            print(f"{file_path}: {error}", file=sys.stderr)
+        else:
+            print(image)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+""" Замеры времени отрисовки кадров, обработки событий и этапов загрузки.
+
+События записываются в кольцевой буфер фиксированного размера, поэтому замеры можно держать включёнными
+сколь угодно долго. Пока замеры выключены, обёрнутые функции вызываются почти без накладных расходов.
+
+Включение: переменная окружения FGP_TRACE=1 или флаг --trace при запуске main.py.
+FGP_TRACE_OVERLAY=1 (--trace-overlay) -- вывод частоты кадров и задержек поверх графика.
+FGP_TRACE_FILE=trace.json (--trace-file) -- сохранение событий при выходе в формате Chrome trace
+(открывается в chrome://tracing или https://ui.perfetto.dev)."""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULT_CAPACITY = 1 << 16
+TRACE_VARIABLE = 'FGP_TRACE'
+OVERLAY_VARIABLE = 'FGP_TRACE_OVERLAY'
+FILE_VARIABLE = 'FGP_TRACE_FILE'
+FRAME_EVENT = 'paint'
+
+
+class Span:
+    """ Класс замера одного участка кода, используемый в блоке with."""
+    __slots__ = ('tracer', 'name', 'category', 'start')
+
+    def __init__(self, tracer, name, category):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *_):
+        self.tracer.record(self.name, self.category, self.start, time.perf_counter_ns())
+        return False
+
+
+class NullSpan:
+    """ Класс пустого замера, используемый, пока замеры выключены."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    """ Класс кольцевого буфера событий с длительностью."""
+    def __init__(self, capacity=DEFAULT_CAPACITY, enabled=False, overlay=False, file_path=None):
+        """ :param capacity: количество последних хранимых событий.
+        :param enabled: признак включённых замеров.
+        :param overlay: признак вывода частоты кадров и задержек поверх графика.
+        :param file_path: путь к файлу Chrome trace, в который события сохраняются при выходе."""
+        # Элементы буфера -- кортежи (название, категория, начало в нс, длительность в нс, поток)
+        self.events = deque(maxlen=capacity)
+        self.enabled = enabled
+        self.overlay = overlay
+        self.file_path = file_path
+        self.origin = time.perf_counter_ns()
+        # Последняя длительность каждого события и времена окончания последних кадров для вывода поверх графика
+        self.latest = {}
+        self.frame_ends = deque(maxlen=256)
+
+    @classmethod
+    def fromEnvironment(cls):
+        """ :return: буфер событий с настройками из переменных окружения FGP_TRACE, FGP_TRACE_OVERLAY и FGP_TRACE_FILE."""
+        overlay = os.environ.get(OVERLAY_VARIABLE, '') not in ('', '0')
+        file_path = os.environ.get(FILE_VARIABLE) or None
+        enabled = os.environ.get(TRACE_VARIABLE, '') not in ('', '0') or overlay or file_path is not None
+        return cls(enabled=enabled, overlay=overlay, file_path=file_path)
+
+    def enable(self, overlay=False, file_path=None):
+        """ Включает замеры.
+        :param overlay: признак вывода частоты кадров и задержек поверх графика.
+        :param file_path: путь к файлу Chrome trace, в который события сохраняются при выходе."""
+        self.enabled = True
+        self.overlay = self.overlay or overlay
+        self.file_path = file_path or self.file_path
+
+    def record(self, name, category, start, end):
+        """ Записывает событие.
+        :param name: название события.
+        :param category: категория события (frame, input, load и т.п.).
+        :param start: время начала по time.perf_counter_ns().
+        :param end: время окончания по time.perf_counter_ns()."""
+        self.events.append((name, category, start, end - start, threading.get_ident()))
+        self.latest[name] = end - start
+        if name == FRAME_EVENT:
+            self.frame_ends.append(end)
+
+    def span(self, name, category=''):
+        """ :return: замер участка кода для блока with, пустой замер, если замеры выключены."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category)
+
+    def traced(self, name=None, category=''):
+        """ Декоратор, замеряющий время выполнения функции.
+        :param name: название события, по умолчанию -- имя функции.
+        :param category: категория события."""
+        def decorator(function):
+            event_name = name or function.__name__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(event_name, category, start, time.perf_counter_ns())
+            return wrapper
+        return decorator
+
+    def framesPerSecond(self, window=1.0):
+        """ :param window: интервал в секундах, по которому считается частота.
+        :return: количество кадров, отрисованных за последние window секунд, делённое на window."""
+        now = time.perf_counter_ns()
+        frame_ends = list(self.frame_ends)
+        count = sum(1 for end in frame_ends if now - end <= window * 1e9)
+        return count / window
+
+    def overlayText(self, names):
+        """ :param names: названия событий, последние длительности которых выводятся.
+        :return: строка вида 'FPS 60 | paint 3.1 мс | wheelEvent 0.4 мс'."""
+        parts = [f"FPS {self.framesPerSecond():.0f}"]
+        for name in names:
+            if name in self.latest:
+                parts.append(f"{name} {self.latest[name] / 1e6:.1f} мс")
+        return " | ".join(parts)
+
+    def chromeTrace(self):
+        """ :return: события в формате Chrome trace (словарь, сериализуемый в JSON)."""
+        process = os.getpid()
+        threads = {}
+        trace_events = []
+        for name, category, start, duration, thread in list(self.events):
+            thread_number = threads.setdefault(thread, len(threads) + 1)
+            trace_events.append({"name": name, "cat": category or "default", "ph": "X", "pid": process,
+                                 "tid": thread_number, "ts": (start - self.origin) / 1000, "dur": duration / 1000})
+        for thread, thread_number in threads.items():
+            thread_name = "main" if thread == threading.main_thread().ident else f"worker {thread_number}"
+            trace_events.append({"name": "thread_name", "ph": "M", "pid": process, "tid": thread_number,
+                                 "args": {"name": thread_name}})
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def exportChromeTrace(self, file_path=None):
+        """ Сохраняет события в файл формата Chrome trace.
+        :param file_path: путь к файлу, по умолчанию -- заданный при включении замеров.
+        :return: путь к сохранённому файлу или None, если путь не задан."""
+        file_path = file_path or self.file_path
+        if file_path is None:
+            return None
+        with open(file_path, 'w') as file:
+            json.dump(self.chromeTrace(), file)
+        return file_path
+
+    def clear(self):
+        """ Удаляет все записанные события."""
+        self.events.clear()
+        self.latest.clear()
+        self.frame_ends.clear()
+
+
+TRACER = Tracer.fromEnvironment()
+traced = TRACER.traced
@@ -1,9 +1,11 @@
-from functools import partial
+import argparse
+from collections import OrderedDict
 from typing import List
 import numpy as np
 import os
 import pandas as pd
 import sys
+import threading
 try:
     from OpenGL.GL import *
     import pyqtgraph.opengl as gl
@@ -13,7 +15,7 @@ try:
     from PyQt5.QtGui import QColor, QFont, QVector3D
     from PyQt5.QtCore import QUrl, pyqtSlot, pyqtSignal
     from PyQt5.QtQuick import QQuickView
-    from PyQt5.QtWidgets import QCheckBox, QDialog, QVBoxLayout, QHBoxLayout, QPushButton
+    from PyQt5.QtWidgets import QCheckBox, QDialog, QVBoxLayout, QHBoxLayout, QProgressBar, QPushButton
 
     qt_imported = True
 except ModuleNotFoundError:
@@ -21,6 +23,14 @@ except ModuleNotFoundError:
 
 from dataclasses import dataclass, field
 
+from batch_loader import expand_paths, load_files
+from capture_file import (CAPTURE_EXTENSION, CaptureFile, common_dtype, compact_channels, narrow_dtype, read_table,
+                          split_time_line)
+from channel_statistics import ChannelStatistics
+from columnar_file import COLUMNAR_EXTENSIONS, open_columnar
+from instrumentation import TRACER, traced
+from parse_cache import ParseCache
+
 @dataclass
 class Points:
     x: List[float] = field(default_factory=lambda: [])
@@ -29,8 +39,9 @@ class Points:
 @dataclass
 class Figure:
     check_box: QCheckBox
-    line: gl.GLLinePlotItem
-    data: Points = Points()
+    data: Points = field(default_factory=Points)
+    channel: int = 0
+    pyramid: "DecimationPyramid" = None
 
 COLORS = ["orange", "green", "blue", "red", "aqua", "orange", "hotpink", "springgreen",
           "blueviolet", "orangered", "royalblue", "green", "plum", "paleturquoise", "palegreen", "navy", "turquoise",
@@ -46,15 +57,620 @@ def find_file_name(file_path):
     return f"{file_path[last_sep + 1:last_dot]}"
 
 
+def build_channel_vertices(values, vertices=None, first_index=0):
+    """ Строит вершины линии канала без поэлементных циклов Python.
+    :param values: отсчёты канала.
+    :param vertices: буфер float32 формы (отсчёты, 3) для заполнения, если None -- создаётся новый.
+    :param first_index: номер первого отсчёта в values.
+    :return: буфер вершин вида (значение, номер отсчёта, 0)."""
+    values_number = len(values)
+    if vertices is None:
+        vertices = np.empty((values_number, 3), dtype=np.float32)
+    vertices[:, 0] = values
+    vertices[:, 1] = np.arange(first_index, first_index + values_number, dtype=np.float32)
+    vertices[:, 2] = 0
+    return vertices
+
+
+def estimate_lines_number(file_path, sample_size=1 << 20):
+    """ Оценивает количество строк в текстовом файле по его началу.
+    :param file_path: путь к файлу.
+    :param sample_size: количество байт, по которым делается оценка.
+    :return: оценка количества строк (точное значение, если файл не больше sample_size)."""
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as file:
+        sample = file.read(sample_size)
+    if not sample:
+        return 0
+    lines_number = sample.count(b'\n') + (not sample.endswith(b'\n'))
+    if len(sample) == file_size:
+        return lines_number
+    return int(file_size * lines_number / len(sample))
+
+
+class GrowableArray:
+    """ Класс массива, растущего вдоль первой оси с увеличением выделенной памяти в growth раз."""
+    def __init__(self, shape_tail=(), dtype=np.float32, capacity=0, growth=2.0):
+        """ :param shape_tail: размеры всех осей массива, кроме первой.
+        :param dtype: тип данных массива.
+        :param capacity: начальное количество строк, под которое выделяется память.
+        :param growth: во сколько раз увеличивается выделенная память, когда её не хватает."""
+        self._buffer = np.empty((capacity,) + tuple(shape_tail), dtype=dtype)
+        self.growth = growth
+        self.size = 0
+
+    @property
+    def dtype(self):
+        """ :return: тип данных массива."""
+        return self._buffer.dtype
+
+    @property
+    def capacity(self):
+        """ :return: количество строк, под которое выделена память."""
+        return len(self._buffer)
+
+    def grow(self, count):
+        """ Увеличивает массив на count строк.
+        :param count: количество новых строк.
+        :return: новые строки массива для заполнения."""
+        needed = self.size + count
+        if needed > len(self._buffer):
+            capacity = max(needed, int(self.growth * len(self._buffer)))
+            buffer = np.empty((capacity,) + self._buffer.shape[1:], dtype=self._buffer.dtype)
+            buffer[:self.size] = self._buffer[:self.size]
+            self._buffer = buffer
+        rows = self._buffer[self.size:needed]
+        self.size = needed
+        return rows
+
+    def append(self, rows):
+        """ Дописывает строки в конец массива.
+        :param rows: массив новых строк."""
+        self.grow(len(rows))[:] = rows
+
+    def truncate(self, size):
+        """ Отбрасывает строки после первых size строк."""
+        self.size = min(self.size, size)
+
+    def astype(self, dtype):
+        """ Переводит массив в другой тип данных с сохранением выделенной памяти под строки.
+        :param dtype: новый тип данных."""
+        buffer = np.empty(self._buffer.shape, dtype=dtype)
+        buffer[:self.size] = self._buffer[:self.size]
+        self._buffer = buffer
+
+    def trim(self):
+        """ Освобождает память, выделенную под незаполненные строки."""
+        if len(self._buffer) > self.size:
+            self._buffer = self._buffer[:self.size].copy()
+
+    def view(self):
+        """ :return: заполненная часть массива без копирования."""
+        return self._buffer[:self.size]
+
+
+class DataFrameChannels:
+    """ Класс, предоставляющий каналы датафрейма в том же виде, что и CaptureFile.
+    Каналы хранятся отдельными массивами в самом узком подходящем типе данных (int16, int32 или float32),
+    поэтому после создания датафрейм можно освободить."""
+    def __init__(self, data, first_channel=0):
+        """ :param data: датафрейм, в котором каждый столбец -- канал, а каждая строка -- отсчёт.
+        :param first_channel: номер столбца, с которого начинаются каналы."""
+        self.first_channel = first_channel
+        self._channels = compact_channels(data, first_channel)
+        self.channels_number = len(self._channels)
+        self.values_number = data.shape[0]
+        self.statistics = ChannelStatistics.fromSource(self)
+
+    def channel(self, index):
+        """ :param index: номер канала.
+        :return: отсчёты канала без копирования."""
+        return self._channels[index]
+
+    def channelRange(self, index):
+        """ :param index: номер канала.
+        :return: минимальное и максимальное значения канала."""
+        return self.statistics.channelRange(index)
+
+
+class OverlayChannels:
+    """ Класс, объединяющий каналы нескольких осциллограмм для отображения на одном графике.
+    Предоставляет каналы в том же виде, что и DataFrameChannels."""
+    def __init__(self, sources, names):
+        """ :param sources: источники каналов.
+        :param names: подписи источников, добавляемые к названиям их каналов."""
+        self.sources = sources
+        self.experiment_time = max(getattr(source, 'experiment_time', 0) for source in sources)
+        self.channels_number = sum(source.channels_number for source in sources)
+        self.values_number = max(source.values_number for source in sources)
+        # Для каждого канала -- источник и номер канала в нём
+        self._index = [(source, channel) for source in sources for channel in range(source.channels_number)]
+        self.names = [f'{name}: channel_{channel + 1}'
+                      for name, source in zip(names, sources) for channel in range(source.channels_number)]
+        self.statistics = ChannelStatistics.combine([getattr(source, 'statistics', None) for source in sources])
+
+    def channel(self, index):
+        """ :param index: номер канала среди всех объединённых каналов.
+        :return: отсчёты канала."""
+        source, channel = self._index[index]
+        values = source.channel(channel)
+        # Источники, читающие каналы по одному, дополняют свой индекс статистики при чтении, а объединённый
+        # индекс -- копия, поэтому канал учитывается и в нём
+        if self.statistics is not None and not self.statistics.indexed[index]:
+            self.statistics.setChannel(index, values)
+        return values
+
+    def channelRange(self, index):
+        """ :param index: номер канала среди всех объединённых каналов.
+        :return: минимальное и максимальное значения канала."""
+        source, channel = self._index[index]
+        return source.channelRange(channel)
+
+
+class GrowableChannels:
+    """ Класс каналов, отсчёты которых дописываются по мере чтения файла.
+    Предоставляет каналы в том же виде, что и DataFrameChannels. Как и там, каналы хранятся в самом узком
+    подходящем типе данных, который расширяется, если очередная часть в него не помещается."""
+    # Во сколько раз увеличивается память канала, если оценки количества строк не хватило
+    GROWTH = 1.25
+
+    def __init__(self, data, first_channel=0, capacity=0):
+        """ :param data: первая часть датафрейма, в котором каждый столбец -- канал.
+        :param first_channel: номер столбца, с которого начинаются каналы.
+        :param capacity: ожидаемое количество отсчётов в каждом канале, под которое сразу выделяется память."""
+        self.first_channel = first_channel
+        self.channels_number = max(data.shape[1] - first_channel, 0)
+        capacity = max(capacity, len(data))
+        self._channels = [GrowableArray(dtype=narrow_dtype(data.iloc[:, first_channel + index].to_numpy()),
+                                        capacity=capacity, growth=self.GROWTH)
+                          for index in range(self.channels_number)]
+        self._min = np.full(self.channels_number, np.inf)
+        self._max = np.full(self.channels_number, -np.inf)
+        # Индекс статистики строится после окончания чтения файла
+        self.statistics = None
+        self.values_number = 0
+        self.append(data)
+
+    def append(self, data):
+        """ Дописывает в каналы новую часть датафрейма.
+        :param data: датафрейм с теми же столбцами, что и первая часть."""
+        for index, channel in enumerate(self._channels):
+            values = data.iloc[:, self.first_channel + index].to_numpy()
+            dtype = common_dtype(channel.dtype, narrow_dtype(values))
+            if dtype != channel.dtype:
+                channel.astype(dtype)
+            channel.append(values)
+            if len(values):
+                with np.errstate(invalid='ignore'):
+                    self._min[index] = np.fmin(self._min[index], np.nanmin(values))
+                    self._max[index] = np.fmax(self._max[index], np.nanmax(values))
+        # Количество отсчётов обновляется после записи, чтобы читатели видели только заполненные строки
+        self.values_number += len(data)
+
+    def trim(self):
+        """ Освобождает память, выделенную по оценке количества строк сверх прочитанного."""
+        for channel in self._channels:
+            # Копирование оправдано, только если лишней памяти заметно много
+            if channel.capacity - channel.size > channel.size // 8:
+                channel.trim()
+
+    def channel(self, index):
+        """ :param index: номер канала.
+        :return: прочитанные на данный момент отсчёты канала."""
+        return self._channels[index].view()
+
+    def channelRange(self, index):
+        """ :param index: номер канала.
+        :return: минимальное и максимальное значения прочитанных отсчётов канала."""
+        return self._min[index], self._max[index]
+
+
+class RingChannels:
+    """ Класс каналов фиксированной ёмкости для отображения данных в реальном времени.
+    Хранит последние capacity отсчётов каждого канала в кольцевом буфере.
+    Запись и чтение защищены блокировкой, поэтому дописывать отсчёты можно из любого потока."""
+    def __init__(self, channels_number, capacity):
+        """ :param channels_number: количество каналов.
+        :param capacity: количество последних отсчётов, хранимых в каждом канале."""
+        self.channels_number = channels_number
+        self.capacity = capacity
+        self._buffer = np.zeros((channels_number, capacity), dtype=np.float32)
+        self._lock = threading.Lock()
+        # Общее количество отсчётов, записанных в каждый канал с момента создания
+        self.values_number = 0
+
+    def append(self, block):
+        """ Дописывает блок отсчётов, вытесняя самые старые.
+        :param block: массив формы (отсчёты, каналы)."""
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim == 1:
+            block = block.reshape(1, -1)
+        with self._lock:
+            count = len(block)
+            if count > self.capacity:
+                block = block[-self.capacity:]
+            start = (self.values_number + count - len(block)) % self.capacity
+            end = start + len(block)
+            if end <= self.capacity:
+                self._buffer[:, start:end] = block.T
+            else:
+                split = self.capacity - start
+                self._buffer[:, start:] = block[:split].T
+                self._buffer[:, :end - self.capacity] = block[split:].T
+            self.values_number += count
+
+    def snapshot(self, index):
+        """ Копирует хранимые отсчёты канала в порядке их поступления.
+        :param index: номер канала.
+        :return: отсчёты канала и общее количество записанных отсчётов на момент копирования."""
+        with self._lock:
+            values_number = self.values_number
+            if values_number <= self.capacity:
+                return self._buffer[index, :values_number].copy(), values_number
+            start = values_number % self.capacity
+            return np.concatenate([self._buffer[index, start:], self._buffer[index, :start]]), values_number
+
+    def channel(self, index):
+        """ :param index: номер канала.
+        :return: хранимые отсчёты канала в порядке их поступления."""
+        return self.snapshot(index)[0]
+
+    def channelRange(self, index):
+        """ :param index: номер канала.
+        :return: минимальное и максимальное значения хранимых отсчётов канала."""
+        values = self.channel(index)
+        if not len(values):
+            return 0, 0
+        return np.nanmin(values), np.nanmax(values)
+
+
+class CsvStreamLoader(QtCore.QThread):
+    """ Класс фонового потока, читающего .csv файл частями.
+    Первая часть читается сразу при создании, чтобы можно было определить строку со временем
+    и количество каналов, остальные -- в потоке с сигналом chunk_loaded после каждой части."""
+    chunk_loaded = pyqtSignal(int)
+
+    def __init__(self, file_path, chunk_size=65536):
+        """ :param file_path: путь к .csv файлу.
+        :param chunk_size: количество строк в одной части."""
+        super().__init__()
+        self.reader = pd.read_csv(filepath_or_buffer=file_path, sep=';', header=None, chunksize=chunk_size)
+        self.first_chunk = next(self.reader)
+        self.estimated_values_number = max(estimate_lines_number(file_path), len(self.first_chunk))
+        self.channels = None
+        self._stopped = False
+        self.completed = False
+
+    def start_loading(self, channels):
+        """ Запускает чтение оставшейся части файла.
+        :param channels: каналы GrowableChannels, в которые дописываются прочитанные отсчёты."""
+        self.channels = channels
+        self.start()
+
+    def run(self):
+        """ Читает оставшиеся части файла и сообщает о каждой прочитанной части."""
+        for chunk in self.reader:
+            if self._stopped:
+                break
+            self.channels.append(chunk)
+            self.chunk_loaded.emit(self.channels.values_number)
+        self.completed = not self._stopped
+
+    def stop(self):
+        """ Останавливает чтение и дожидается завершения потока."""
+        self._stopped = True
+        self.wait()
+
+
+class LoaderTask(QtCore.QRunnable):
+    """ Задача пула потоков, выполняющая один этап загрузки и передающая результат через сигналы конвейера."""
+    def __init__(self, pipeline, key, function, args):
+        """ :param pipeline: конвейер LoaderPipeline, которому принадлежит задача.
+        :param key: ключ задачи, передаваемый вместе с результатом.
+        :param function: выполняемая функция.
+        :param args: аргументы функции."""
+        super().__init__()
+        self.pipeline = pipeline
+        self.key = key
+        self.function = function
+        self.args = args
+
+    def run(self):
+        """ Выполняет функцию, если загрузка не отменена. Результат отменённой загрузки отбрасывается."""
+        if self.pipeline.cancelled.is_set():
+            return
+        try:
+            result = self.function(*self.args)
+        except Exception as error:
+            if not self.pipeline.cancelled.is_set():
+                self.pipeline.task_failed.emit(self.key, f"{type(error).__name__}: {error}")
+            return
+        if not self.pipeline.cancelled.is_set():
+            self.pipeline.task_done.emit(self.key, result)
+
+
+class LoaderPipeline(QtCore.QObject):
+    """ Класс конвейера фоновой загрузки. Разбор файлов и подготовка вершин выполняются в пуле потоков,
+    результаты передаются в поток интерфейса сигналом task_done, поэтому цикл событий Qt не блокируется."""
+    task_done = pyqtSignal(object, object)
+    task_failed = pyqtSignal(object, str)
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, max_threads=None):
+        """ :param max_threads: количество потоков пула, по умолчанию -- количество ядер."""
+        super().__init__()
+        self.pool = QtCore.QThreadPool()
+        if max_threads:
+            self.pool.setMaxThreadCount(max_threads)
+        self.cancelled = threading.Event()
+        self.submitted = 0
+        self.completed = 0
+        # Подключены первыми, поэтому счётчик обновляется до обработки результата получателями
+        self.task_done.connect(self.taskFinished)
+        self.task_failed.connect(self.taskFinished)
+
+    def submit(self, key, function, *args):
+        """ Ставит этап загрузки в очередь пула.
+        :param key: ключ задачи, передаваемый вместе с результатом.
+        :param function: функция, выполняемая в потоке пула.
+        :param args: аргументы функции."""
+        self.submitted += 1
+        self.progress.emit(self.completed, self.submitted)
+        self.pool.start(LoaderTask(self, key, function, args))
+
+    def taskFinished(self, *_):
+        """ Учитывает завершённую задачу и сообщает о ходе загрузки."""
+        self.completed += 1
+        self.progress.emit(self.completed, self.submitted)
+
+    def isIdle(self):
+        """ :return: True, если все поставленные задачи завершены и их результаты обработаны."""
+        return self.completed >= self.submitted
+
+    def cancel(self):
+        """ Отменяет загрузку: задачи из очереди удаляются, результаты выполняющихся отбрасываются.
+        Не дожидается завершения выполняющихся задач, чтобы не блокировать поток интерфейса."""
+        self.cancelled.set()
+        self.pool.clear()
+
+
+class DecimationPyramid:
+    """ Класс, хранящий уровни детализации линии канала.
+    Каждый следующий уровень объединяет отсчёты в блоки в decimation_factor раз крупнее
+    и сохраняет для каждого блока его минимум и максимум в исходном порядке, поэтому
+    выбросы сигнала не теряются при отдалении.
+    Уровни хранят только значения в типе данных канала, уровень 0 -- сами отсчёты канала без копирования.
+    Номера отсчётов вершин вычисляются при построении отрезков: на уровне 0 вершина j соответствует
+    отсчёту j, на остальных две вершины блока располагаются в его начале и середине."""
+    def __init__(self, values, decimation_factor=4, min_level_size=4096, chunk_size=1024):
+        """ :param values: отсчёты канала (одномерный массив).
+        :param decimation_factor: во сколько раз увеличивается размер блока на каждом уровне.
+        :param min_level_size: количество вершин, при котором построение уровней прекращается.
+        :param chunk_size: количество отрезков в части уровня, для которой хранится ограничивающий прямоугольник."""
+        self.decimation_factor = decimation_factor
+        self.min_level_size = min_level_size
+        self.chunk_size = chunk_size
+        self.values_number = 0
+        # levels[k] -- значения вершин уровня k, bucket_sizes[k] -- количество отсчётов в блоке уровня k
+        self.levels = [values]
+        self.bucket_sizes = [1]
+        # Буферы уровней и количество окончательно посчитанных групп предыдущего уровня в каждом из них
+        self._level_buffers = [None]
+        self._complete_groups = [0]
+        # Ограничивающие прямоугольники частей уровней и количество вершин уровня, не изменившихся с их расчёта
+        self._chunk_bounds = [None]
+        self._unchanged_points = [0]
+
+        self.extend(values)
+
+    def extend(self, values):
+        """ Обновляет уровни после дописывания новых отсчётов в конец линии.
+        Пересчитываются только новые группы и последняя неполная группа каждого уровня.
+        :param values: все отсчёты канала, включая дописанные."""
+        if self.values_number and values.dtype != self.levels[0].dtype:
+            # Тип данных канала расширился при дописывании, уровни строятся заново в новом типе
+            self.__init__(values, self.decimation_factor, self.min_level_size, self.chunk_size)
+            return
+        self._unchanged_points[0] = min(self._unchanged_points[0], self.values_number)
+        self.levels[0] = values
+        self.values_number = len(values)
+        final_points = len(values)
+        level = 1
+        while level < len(self.levels) or len(self.levels[level - 1]) > self.min_level_size:
+            if level == len(self.levels):
+                self.levels.append(None)
+                self.bucket_sizes.append(self.bucket_sizes[-1] * self.decimation_factor)
+                self._level_buffers.append(GrowableArray((), values.dtype))
+                self._complete_groups.append(0)
+                self._chunk_bounds.append(None)
+                self._unchanged_points.append(0)
+
+            # Из уровня 0 в группу попадает по одной вершине на отсчёт, из остальных -- по две на блок
+            group_size = self.decimation_factor * (1 if level == 1 else 2)
+            complete = self._complete_groups[level]
+            tail = self.levels[level - 1][complete * group_size:]
+            buffer = self._level_buffers[level]
+            buffer.truncate(2 * complete)
+            self._unchanged_points[level] = min(self._unchanged_points[level], 2 * complete)
+            if len(tail):
+                buffer.append(tail[self.extremaOrder(tail, group_size)])
+            self.levels[level] = buffer.view()
+
+            # Окончательными считаются только группы, составленные из окончательных вершин предыдущего уровня
+            self._complete_groups[level] = complete + max(final_points - complete * group_size, 0) // group_size
+            final_points = 2 * self._complete_groups[level]
+            level += 1
+
+    @classmethod
+    def fromLevels(cls, levels, chunk_bounds, decimation_factor=4, min_level_size=4096, chunk_size=1024):
+        """ Восстанавливает уровни детализации, построенные ранее (например, сохранённые в кэше).
+        Восстановленные уровни не дополняются через extend().
+        :param levels: значения вершин уровней, уровень 0 -- отсчёты канала.
+        :param chunk_bounds: ограничивающие прямоугольники частей каждого уровня, как их возвращает chunkBounds().
+        :return: пирамида уровней детализации."""
+        pyramid = cls.__new__(cls)
+        pyramid.decimation_factor = decimation_factor
+        pyramid.min_level_size = min_level_size
+        pyramid.chunk_size = chunk_size
+        pyramid.values_number = len(levels[0])
+        pyramid.levels = list(levels)
+        pyramid.bucket_sizes = [decimation_factor ** level for level in range(len(levels))]
+        pyramid._level_buffers = [None] * len(levels)
+        pyramid._complete_groups = [0] * len(levels)
+        pyramid._chunk_bounds = list(chunk_bounds)
+        pyramid._unchanged_points = [len(values) for values in levels]
+        return pyramid
+
+    def cacheData(self):
+        """ :return: значения вершин уровней начиная с первого (уровень 0 -- отсчёты канала, хранящиеся отдельно),
+                 ограничивающие прямоугольники частей всех уровней и параметры построения
+                 для сохранения и последующего восстановления через fromLevels()."""
+        chunk_bounds = [self.chunkBounds(level) for level in range(len(self.levels))]
+        parameters = {'decimation_factor': self.decimation_factor, 'min_level_size': self.min_level_size,
+                      'chunk_size': self.chunk_size}
+        return self.levels[1:], chunk_bounds, parameters
+
+    @staticmethod
+    def extremaOrder(values, group_size):
+        """ Разбивает значения на группы и находит в каждой группе минимум и максимум.
+        :param values: одномерный массив значений.
+        :param group_size: количество значений в группе.
+        :return: номера минимума и максимума каждой группы в порядке их следования, 2 * количество групп номеров."""
+        groups_number = -(-len(values) // group_size)
+        padding = groups_number * group_size - len(values)
+        if padding:
+            # Последняя неполная группа дополняется своим же последним значением
+            values = np.concatenate([values, np.repeat(values[-1:], padding)])
+        values = values.reshape(groups_number, group_size)
+        min_values = max_values = values
+        if np.issubdtype(values.dtype, np.floating):
+            # argmin и argmax возвращают номер NaN, поэтому пропуски не должны вытеснять экстремумы группы
+            missing = np.isnan(values)
+            if missing.any():
+                min_values = np.where(missing, np.inf, values)
+                max_values = np.where(missing, -np.inf, values)
+
+        group_starts = np.arange(groups_number) * group_size
+        last_index = groups_number * group_size - padding - 1
+        min_index = np.minimum(group_starts + np.argmin(min_values, axis=1), last_index)
+        max_index = np.minimum(group_starts + np.argmax(max_values, axis=1), last_index)
+        order = np.empty(2 * groups_number, dtype=np.int64)
+        order[0::2] = np.minimum(min_index, max_index)
+        order[1::2] = np.maximum(min_index, max_index)
+        return order
+
+    @staticmethod
+    def decimate(vertices, group_size):
+        """ Разбивает вершины на группы и оставляет в каждой группе минимум и максимум.
+        :param vertices: вершины формы (n, 3).
+        :param group_size: количество вершин в группе.
+        :return: вершины формы (2 * количество групп, 3), упорядоченные по номеру отсчёта."""
+        return vertices[DecimationPyramid.extremaOrder(vertices[:, 0], group_size)]
+
+    def vertexIndices(self, level, vertices):
+        """ Вычисляет номера отсчётов вершин уровня.
+        :param level: номер уровня.
+        :param vertices: номера вершин уровня.
+        :return: номера отсчётов вершин в float32."""
+        step = 1 if level == 0 else self.bucket_sizes[level] / 2
+        indices = np.asarray(vertices, dtype=np.float64) * step
+        return np.minimum(indices, max(self.values_number - 1, 0)).astype(np.float32)
+
+    def selectLevel(self, samples_per_pixel):
+        """ Выбирает самый грубый уровень, блок которого не крупнее одного пикселя.
+        :param samples_per_pixel: количество отсчётов, приходящихся на пиксель экрана.
+        :return: номер уровня."""
+        level = 0
+        while level + 1 < len(self.levels) and self.bucket_sizes[level + 1] <= samples_per_pixel:
+            level += 1
+        return level
+
+    def chunkBounds(self, level):
+        """ Возвращает ограничивающие прямоугольники частей уровня. Часть номер k состоит из вершин
+        с k * chunk_size по (k + 1) * chunk_size включительно, поэтому соседние части имеют общую вершину
+        и отрезок между ними не теряется. Пересчитываются только части, изменившиеся после extend().
+        :param level: номер уровня.
+        :return: массивы минимумов и максимумов значений и первых и последних номеров отсчётов частей."""
+        values = self.levels[level]
+        vertices_number = len(values)
+        chunks_number = max(-(-(vertices_number - 1) // self.chunk_size), 0)
+        bounds = self._chunk_bounds[level]
+        if bounds is not None and self._unchanged_points[level] == vertices_number and len(bounds[0]) == chunks_number:
+            return bounds
+
+        # Части, все вершины которых не изменились, пересчитывать не нужно
+        stable_chunks = 0
+        if bounds is not None:
+            stable_chunks = min(max((self._unchanged_points[level] - 1) // self.chunk_size, 0), len(bounds[0]))
+        starts = np.arange(stable_chunks, chunks_number) * self.chunk_size
+        ends = np.minimum(starts + self.chunk_size, vertices_number - 1)
+        new_bounds = [np.empty(0, dtype=values.dtype)] * 2 + [np.empty(0, dtype=np.float32)] * 2
+        if len(starts):
+            new_bounds = [np.fmin(np.fmin.reduceat(values, starts), values[ends]),
+                          np.fmax(np.fmax.reduceat(values, starts), values[ends]),
+                          self.vertexIndices(level, starts), self.vertexIndices(level, ends)]
+        if bounds is not None and stable_chunks:
+            new_bounds = [np.concatenate([old[:stable_chunks], new]) for old, new in zip(bounds, new_bounds)]
+        self._chunk_bounds[level] = new_bounds
+        self._unchanged_points[level] = vertices_number
+        return new_bounds
+
+    def getVisible(self, view_rect, samples_per_pixel):
+        """ Возвращает отрезки видимых частей линии на подходящем уровне детализации.
+        Части, ограничивающий прямоугольник которых не пересекает видимую область, отбрасываются.
+        Координаты вершин (значение, номер отсчёта, 0) строятся только для возвращаемых отрезков.
+        :param view_rect: видимая область (x_min, x_max, y_min, y_max), где x -- значение, y -- номер отсчёта.
+        :param samples_per_pixel: количество отсчётов, приходящихся на пиксель экрана.
+        :return: вершины float32 формы (2 * количество отрезков, 3) для отрисовки в режиме 'lines'."""
+        level = self.selectLevel(samples_per_pixel)
+        values = self.levels[level]
+        if len(values) < 2:
+            return np.empty((0, 3), dtype=np.float32)
+        value_min, value_max, index_first, index_last = self.chunkBounds(level)
+        x_min, x_max, y_min, y_max = view_rect
+
+        # Части упорядочены по номерам отсчётов, поэтому диапазон по номерам находится бинарным поиском
+        first = np.searchsorted(index_last, y_min, side='left')
+        last = np.searchsorted(index_first, y_max, side='right')
+        candidates = np.arange(first, last)
+        visible = candidates[(value_max[first:last] >= x_min) & (value_min[first:last] <= x_max)]
+        if not len(visible):
+            return np.empty((0, 3), dtype=np.float32)
+
+        # Соседние видимые части объединяются в непрерывные участки
+        breaks = np.flatnonzero(np.diff(visible) > 1)
+        run_starts = visible[np.r_[0, breaks + 1]]
+        run_ends = visible[np.r_[breaks, len(visible) - 1]]
+        segments = []
+        for run_start, run_end in zip(run_starts, run_ends):
+            first_vertex = run_start * self.chunk_size
+            last_vertex = min((run_end + 1) * self.chunk_size, len(values) - 1) + 1
+            run_values = values[first_vertex:last_vertex]
+            run_indices = self.vertexIndices(level, np.arange(first_vertex, last_vertex))
+            run_segments = np.zeros((2 * (len(run_values) - 1), 3), dtype=np.float32)
+            run_segments[0::2, 0] = run_values[:-1]
+            run_segments[1::2, 0] = run_values[1:]
+            run_segments[0::2, 1] = run_indices[:-1]
+            run_segments[1::2, 1] = run_indices[1:]
+            segments.append(run_segments)
+        return np.concatenate(segments)
+
+
 class AxisValuesItem:
-    """ Класс, хранящий и создающий подписи для координатных осей. """
+    """ Класс, хранящий и создающий подписи для координатных осей.
+    Подписи берутся из пула и создаются только для видимой части осей: при смене масштаба
+    или области обзора у уже созданных подписей меняются только текст и положение."""
     def __init__(self, axis_length, experiment_time = 1):
         """ :param axis_length: длина оси
         :param experiment_time: длительность эксперимента в секундах (aka максимальное значение по оси x) """
         super().__init__()
         self.font = QFont('Helvetica', 10)
         # Задаём начальные значения размера и масштаба
-        self.coordinate_dots = []
+        self.coordinate_dots = []   # все созданные подписи, включая скрытые
+        self.visible_labels = {}    # отображаемые подписи по ключу (ось, точка оси)
+        self.label_texts = {}       # текст отображаемых подписей по тому же ключу
+        self.free_labels = []       # скрытые подписи, доступные для повторного использования
+        self.view_rect = None       # видимая область (x_min, x_max, y_min, y_max), None -- вся ось
         self.current_width = axis_length // 4
         self.current_spacing = self.current_width // 20
 
@@ -65,45 +681,102 @@ class AxisValuesItem:
 
         self.setUpTextItems()
 
-    def setUpTextItems(self):
-        """ Заполняет массив точек self.coordinate_dots текстовыми объектами
-        gl.GLTextItem с текстом и расположением соответствующими точке
-        координатной оси. Отсчет начинается с 0 и идёт с шагом step. """
-        self.coordinate_dots = []
-        current_x_value = 0
+    def visibleDots(self, low, high):
+        """ Выбирает точки оси с подписями, попадающие в отрезок [low, high].
+        :return: диапазон номеров точек; точка с номером i расположена в 1 + i * current_spacing."""
+        dots_number = len(range(1, self.current_width + 1, self.current_spacing))
+        first = int(np.clip(np.ceil((low - 1) / self.current_spacing), 0, dots_number))
+        last = int(np.clip(np.floor((high - 1) / self.current_spacing) + 1, 0, dots_number))
+        return range(first, max(first, last))
+
+    def labelsData(self):
+        """ Вычисляет подписи, попадающие в видимую область.
+        :return: словарь вида ключ подписи -- (положение, текст)."""
+        x_min, x_max, y_min, y_max = self.view_rect or (-np.inf, np.inf, -np.inf, np.inf)
         step = self.max_x_value / 20
-        for dot in range(1, self.current_width + 1, self.current_spacing):
-            current_x_value += step
-            current_y_value = dot
+        y_label_pos = -2.0 * self.max_digits_number
+        labels = {}
+        if x_min <= -3.0 <= x_max:
+            for index in self.visibleDots(y_min, y_max):
+                dot = 1 + index * self.current_spacing
+                labels[('x', dot)] = ((-3.0, dot, 0), f"{(index + 1) * step:.2f}")
+        if y_min <= y_label_pos <= y_max:
+            for index in self.visibleDots(x_min, x_max):
+                dot = 1 + index * self.current_spacing
+                labels[('y', dot)] = ((dot, y_label_pos, 0), f"{dot}")
+        return labels
 
-            x_dot_pos = gl.GLTextItem(color="black", pos=(-3.0, dot, 0), text=f"{current_x_value:.2f}", font=self.font)
-            y_dot_pos = gl.GLTextItem(color="black", pos=(current_y_value, -2.0 * self.max_digits_number, 0), text=f"{current_y_value}", font=self.font)
-
-            self.coordinate_dots.append(x_dot_pos)
-            self.coordinate_dots.append(y_dot_pos)
+    def setUpTextItems(self):
+        """ Приводит подписи в соответствие с текущими масштабом и видимой областью.
+        Ушедшие из видимой области подписи скрываются и возвращаются в пул, новые берутся из пула,
+        у остальных меняется только текст, если он изменился.
+        :return: список созданных подписей, которые необходимо добавить на график."""
+        labels = self.labelsData()
+        for key in [key for key in self.visible_labels if key not in labels]:
+            item = self.visible_labels.pop(key)
+            del self.label_texts[key]
+            item.hide()
+            self.free_labels.append(item)
+
+        new_items = []
+        for key, (pos, text) in labels.items():
+            item = self.visible_labels.get(key)
+            if item is None:
+                if self.free_labels:
+                    item = self.free_labels.pop()
+                    item.setData(pos=pos, text=text)
+                    item.show()
+                else:
+                    item = gl.GLTextItem(color="black", pos=pos, text=text, font=self.font)
+                    self.coordinate_dots.append(item)
+                    new_items.append(item)
+                self.visible_labels[key] = item
+            elif self.label_texts[key] != text:
+                item.setData(text=text)
+            self.label_texts[key] = text
+        return new_items
+
+    def setViewRect(self, view_rect):
+        """ Задаёт видимую область и обновляет подписи.
+        :param view_rect: видимая область (x_min, x_max, y_min, y_max).
+        :return: список созданных подписей, которые необходимо добавить на график."""
+        self.view_rect = view_rect
+        return self.setUpTextItems()
 
     def doubleUpTextSpacing(self):
-        """ Увеличивает масштаб в 2 раза. """
+        """ Увеличивает масштаб в 2 раза.
+        :return: список созданных подписей, которые необходимо добавить на график."""
         self.current_spacing *= 2
-        self.setUpTextItems()
+        return self.setUpTextItems()
 
     def doubleDownTextSpacing(self):
-        """ Уменьшает масштаб в 2 раза, если после уменьшения он не станет меньше 1. """
+        """ Уменьшает масштаб в 2 раза, если после уменьшения он не станет меньше 1.
+        :return: список созданных подписей, которые необходимо добавить на график."""
         self.current_spacing //= 2
         if self.current_spacing == 0:
             self.current_spacing = 1
-        self.setUpTextItems()
+        return self.setUpTextItems()
 
 class GridItem:
-    """ Класс, представляющий квадратную координатную сетку."""
+    """ Класс, представляющий квадратную координатную сетку.
+    Вся сетка рисуется одной линией в режиме отрезков. Вершины строятся только для области вокруг видимой
+    части графика, а их количество ограничено: при слишком частой для этой области сетке рисуется каждая
+    вторая, четвёртая и т.д. линия. Область построения выравнивается по крупной сетке, поэтому при перемещении
+    и масштабировании вершины берутся из кэша последних построений."""
+    MAX_LINES = 1000    # наибольшее количество линий одного направления до выравнивания области
+    CELL_LINES = 100    # количество шагов линий в ячейке крупной сетки, по которой выравнивается область
+    CACHE_SIZE = 16     # количество хранимых построений
+
     def __init__(self, length = 0):
         """Задаёт начальные данные сетки.
         :param length: длина ребра квадрата сетки."""
         self.color = QColor(195, 195, 195)
-        self.grid_lines = None
-        self.x_lines_list = []
-        self.y_lines_list = []
         self.length = length + 1
+        self.geometry_cache = OrderedDict()     # вершины сетки по ключу (шаг линий, область построения)
+        self.view_rect = None       # видимая область (x_min, x_max, y_min, y_max), None -- вся сетка
+        self.grid_key = None        # шаг линий и область построения текущих вершин
+        self.grid_line = gl.GLLinePlotItem(mode='lines', width=1, antialias=False, glOptions='translucent', color=self.color)
+        self.grid_lines = [self.grid_line]
 
         #TODO: потенциально улучшить
         self.starting_spacing = length // 40
@@ -113,21 +786,82 @@ class GridItem:
 
         self.setSpacing(self.spacing)
 
+    def clamp(self, value):
+        """ :return: координата, ограниченная квадратом сетки."""
+        return float(min(max(value, 0), self.length))
+
+    def gridKey(self, spacing):
+        """ Определяет шаг линий и область построения для масштаба сетки и видимой области.
+        Видимая область расширяется на свой размер с каждой стороны, шаг увеличивается вдвое, пока линий
+        одного направления больше MAX_LINES, после чего область выравнивается по ячейкам из CELL_LINES шагов
+        и ограничивается квадратом сетки.
+        :param spacing: масштаб сетки.
+        :return: пара (шаг линий, область построения (x_min, x_max, y_min, y_max))."""
+        if self.view_rect is None:
+            x_min, x_max, y_min, y_max = 0, self.length, 0, self.length
+        else:
+            x_min, x_max, y_min, y_max = self.view_rect
+            width, height = x_max - x_min, y_max - y_min
+            x_min, x_max, y_min, y_max = x_min - width, x_max + width, y_min - height, y_max + height
+        step = max(spacing, 1)
+        while max(x_max - x_min, y_max - y_min) / step > self.MAX_LINES:
+            step *= 2
+        cell = step * self.CELL_LINES
+        region = tuple(self.clamp(bound) for bound in (np.floor(x_min / cell) * cell, np.ceil(x_max / cell) * cell,
+                                                       np.floor(y_min / cell) * cell, np.ceil(y_max / cell) * cell))
+        return step, region
+
+    def gridGeometry(self, step, region):
+        """ Строит вершины отрезков сетки с заданным шагом линий в области построения.
+        :param step: шаг линий.
+        :param region: область построения (x_min, x_max, y_min, y_max) внутри квадрата сетки.
+        :return: массив формы (2 * количество линий, 3), каждая пара вершин -- отрезок."""
+        key = (step, region)
+        if key in self.geometry_cache:
+            self.geometry_cache.move_to_end(key)
+            return self.geometry_cache[key]
+        x_min, x_max, y_min, y_max = region
+
+        def positions(low, high):
+            first = max(np.ceil(low / step), 1) * step
+            return np.arange(first, min(high, self.length), step, dtype=np.float32)
+
+        if x_min >= x_max or y_min >= y_max:
+            # Видимая область целиком за пределами сетки
+            rows = columns = np.empty(0, dtype=np.float32)
+        else:
+            rows = positions(y_min, y_max)
+            columns = positions(x_min, x_max)
+        vertices = np.zeros((2 * (len(rows) + len(columns)), 3), dtype=np.float32)
+        # Горизонтальные линии: от (x_min, y) до (x_max, y)
+        horizontal = vertices[:2 * len(rows)]
+        horizontal[:, 1] = np.repeat(rows, 2)
+        horizontal[0::2, 0] = x_min
+        horizontal[1::2, 0] = x_max
+        # Вертикальные линии: от (x, y_min) до (x, y_max)
+        vertical = vertices[2 * len(rows):]
+        vertical[:, 0] = np.repeat(columns, 2)
+        vertical[0::2, 1] = y_min
+        vertical[1::2, 1] = y_max
+
+        self.geometry_cache[key] = vertices
+        if len(self.geometry_cache) > self.CACHE_SIZE:
+            self.geometry_cache.popitem(last=False)
+        return vertices
+
     def setSpacing(self, spacing = 1):
-        """ Изменяет масштаб сетки.
+        """ Изменяет масштаб сетки, заменяя вершины уже добавленной на график линии.
         :param spacing: необходимый масштаб"""
-        self.x_lines_list = []
-        self.y_lines_list = []
-        for current_y in range(spacing, self.length, spacing):
-            x_line_dots = np.array([(0, current_y, 0), (self.length, current_y, 0)])
-            line = gl.GLLinePlotItem(pos=x_line_dots, width=1, antialias=False, glOptions='translucent', color=self.color)
-            self.x_lines_list.append(line)
-
-        for current_x in range(spacing, self.length, spacing):
-            y_line_dots = np.array([(current_x, 0, 0), (current_x, self.length, 0)])
-            line = gl.GLLinePlotItem(pos=y_line_dots, width=1, antialias=False, glOptions='translucent', color=self.color)
-            self.y_lines_list.append(line)
-        self.grid_lines = self.x_lines_list + self.y_lines_list
+        self.grid_key = self.gridKey(spacing)
+        self.grid_line.setData(pos=self.gridGeometry(*self.grid_key))
+
+    def setViewRect(self, view_rect):
+        """ Задаёт видимую область. Вершины заменяются, только если изменились шаг линий или выровненная
+        область построения.
+        :param view_rect: видимая область (x_min, x_max, y_min, y_max)."""
+        self.view_rect = view_rect
+        if self.gridKey(self.spacing) != self.grid_key:
+            self.setSpacing(self.spacing)
 
     def doubleUpGridSpacing(self):
         """ Увеличивает масштаб сетки в 2 раза, если он не превысит первоначальный
@@ -151,19 +885,127 @@ class GridItem:
         return self.grid_lines
 
 
+class PackedLinesItem(gl.GLLinePlotItem):
+    """ Класс, рисующий линии всех каналов из одного общего буфера вершин.
+    Для каждого канала хранятся его диапазон в буфере, цвет и признак видимости,
+    поэтому скрытие и отображение канала меняет только набор рисуемых диапазонов."""
+    def __init__(self, **kwds):
+        """ Все именованные аргументы передаются в gl.GLLinePlotItem."""
+        super().__init__(**kwds)
+        self.channel_vertices = []  # вершины каждого канала, из которых собирается общий буфер
+        self.channel_ranges = []    # пары вида смещение - количество вершин канала в общем буфере
+        self.channel_colors = []
+        self.channel_visible = []
+        self._packed_dirty = False
+
+    def addChannel(self, color, visible=True):
+        """ Добавляет канал без вершин.
+        :param color: цвет линии канала.
+        :param visible: признак видимости канала.
+        :return: номер канала."""
+        self.channel_vertices.append(np.empty((0, 3), dtype=np.float32))
+        self.channel_ranges.append((0, 0))
+        self.channel_colors.append(QColor(color).getRgbF())
+        self.channel_visible.append(visible)
+        return len(self.channel_vertices) - 1
+
+    def setChannelsData(self, channels_data):
+        """ Заменяет вершины нескольких каналов и заново собирает общий буфер.
+        :param channels_data: словарь вида номер канала -- вершины формы (n, 3)."""
+        for channel, vertices in channels_data.items():
+            self.channel_vertices[channel] = vertices
+        lengths = np.array([len(vertices) for vertices in self.channel_vertices], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        self.channel_ranges = list(zip(offsets.tolist(), lengths.tolist()))
+        self.pos = np.ascontiguousarray(np.concatenate(self.channel_vertices), dtype=np.float32)
+        self._packed_dirty = True
+        self.update()
+
+    def setChannelsVisible(self, channels_visible):
+        """ Меняет видимость нескольких каналов с одной перерисовкой.
+        :param channels_visible: словарь вида номер канала -- признак видимости."""
+        for channel, visible in channels_visible.items():
+            self.channel_visible[channel] = visible
+        self.update()
+
+    @traced('lines_paint', 'frame')
+    def paint(self):
+        """ Рисует видимые каналы отдельными вызовами glDrawArrays по их диапазонам общего буфера."""
+        if self.pos is None or not len(self.pos):
+            return
+        self.setupGLState()
+        mat_mvp = np.array(self.mvpMatrix().data(), dtype=np.float32)
+        context = QtGui.QOpenGLContext.currentContext()
+
+        if self._packed_dirty:
+            self.upload_vbo(self.m_vbo_position, self.pos)
+            self._packed_dirty = False
+        program = self.getShaderProgram()
+
+        self.m_vbo_position.bind()
+        glVertexAttribPointer(0, 3, GL_FLOAT, False, 0, None)
+        self.m_vbo_position.release()
+
+        sfmt = context.format()
+        core_forward_compatible = (sfmt.profile() == sfmt.OpenGLContextProfile.CoreProfile
+                                   and not sfmt.testOption(sfmt.FormatOption.DeprecatedFunctions))
+        if not core_forward_compatible:
+            glLineWidth(self.width)
+
+        primitive = GL_LINE_STRIP if self.mode == 'line_strip' else GL_LINES
+        glEnableVertexAttribArray(0)
+        with program:
+            glUniformMatrix4fv(glGetUniformLocation(program, "u_mvp"), 1, False, mat_mvp)
+            for (offset, count), color, visible in zip(self.channel_ranges, self.channel_colors, self.channel_visible):
+                if visible and count:
+                    glVertexAttrib4f(1, *color)
+                    glDrawArrays(primitive, offset, count)
+        glDisableVertexAttribArray(0)
+        glLineWidth(1.0)
+
+
 class MyGLViewWidget(gl.GLViewWidget):
     """ Класс виджета графика, основанный на gl.GLViewWidget.
     Добавлены функции  """
+    # События, последние длительности которых выводятся поверх графика при включённых замерах
+    OVERLAY_EVENTS = ('paint', 'wheelEvent', 'mouseMoveEvent', 'updateLevelOfDetail')
+
     def __init__(self, axis_length, experiment_time):
         super().__init__()
         self._down_pos = None
         self._prev_zoom_pos = None
         self._prev_pan_pos = None
         self.scale_iterator = 0     # переменная счётчик для масштабирования сетки и подписей осей
+        self.lod_lines = []         # тройки вида линии - номер канала в них - пирамида уровней детализации канала
         self.grid = GridItem(length=axis_length//4)
         self.addGrid()
         self.axis_values = AxisValuesItem(axis_length=axis_length, experiment_time=experiment_time)
         self.addAxisValues()
+        self.overlay_timer = None
+        if TRACER.overlay:
+            # Перерисовка раз в секунду, чтобы частота кадров на графике обновлялась и без действий пользователя
+            self.overlay_timer = QtCore.QTimer(self)
+            self.overlay_timer.timeout.connect(self.update)
+            self.overlay_timer.start(1000)
+
+    def paintGL(self, *args, **kwargs):
+        """ Рисует график, замеряя время кадра, и при включённом выводе замеров -- частоту кадров и задержки."""
+        with TRACER.span('paint', 'frame'):
+            super().paintGL(*args, **kwargs)
+        if TRACER.overlay:
+            self.paintOverlay()
+
+    def paintOverlay(self):
+        """ Выводит в левом верхнем углу частоту кадров и последние длительности кадра и обработки событий.
+        Текст рисуется тёмным цветом на полупрозрачной светлой подложке, чтобы его не заслоняли сетка и линии."""
+        text = TRACER.overlayText(self.OVERLAY_EVENTS)
+        painter = QtGui.QPainter(self)
+        painter.setFont(QFont('Helvetica', 10))
+        text_rect = painter.fontMetrics().boundingRect(text).translated(8, 16)
+        painter.fillRect(text_rect.adjusted(-4, -2, 4, 2), QColor(255, 255, 255, 220))
+        painter.setPen(QColor(0, 0, 0))
+        painter.drawText(QtCore.QPointF(8, 16), text)
+        painter.end()
 
     def mousePressEvent(self, ev):
         """ Событие нажатия мыши. Дополнительно сохраняет позицию курсора при нажатии."""
@@ -178,9 +1020,11 @@ class MyGLViewWidget(gl.GLViewWidget):
                 x = ev.pos().x() - self.width() / 2
                 y = ev.pos().y() - self.height() / 2
                 self.pan(-x, -y, 0, relative=True)
+                self.viewChanged()
         self._prev_zoom_pos = None
         self._prev_pan_pos = None
 
+    @traced(category='input')
     def mouseMoveEvent(self, ev):
         """ Событие движения мыши. Позволяет перемещать график в 2D."""
         pos = ev.pos().x(), ev.pos().y()
@@ -191,7 +1035,9 @@ class MyGLViewWidget(gl.GLViewWidget):
         dy = pos[1] - self._prev_pan_pos[1]
         self.pan(dx, dy, 0, relative="view")
         self._prev_pan_pos = pos
+        self.viewChanged()
 
+    @traced(category='input')
     def wheelEvent(self, ev):
         """ Событие колёсика мыши. Позволяет регулировать масштаб графика.
         Так же масштабирует сетку и подписи координатных осей."""
@@ -225,29 +1071,85 @@ class MyGLViewWidget(gl.GLViewWidget):
                 self.grid.set_minimum_spacing = False
 
             self.opts['distance'] *= 0.999**delta
+        self.viewChanged()
         self.update()
 
+    def addLodLine(self, lines, channel, pyramid):
+        """ Регистрирует канал, данные которого выбираются по уровню детализации.
+        :param lines: линии PackedLinesItem, в которых рисуется канал.
+        :param channel: номер канала в lines.
+        :param pyramid: пирамида уровней детализации данных канала."""
+        self.lod_lines.append((lines, channel, pyramid))
+
+    def visibleHalfExtent(self):
+        """ Оценивает половину размера видимой области в координатах графика с запасом по большей стороне окна."""
+        width = max(self.width(), 1)
+        height = max(self.height(), 1)
+        return self.opts['distance'] * np.tan(0.5 * np.radians(self.opts['fov'])) * max(1, height / width)
+
+    def visibleRect(self):
+        """ :return: видимая область графика (x_min, x_max, y_min, y_max) по текущим opts['distance'] и opts['center']."""
+        half_extent = self.visibleHalfExtent()
+        center = self.opts['center']
+        return (center.x() - half_extent, center.x() + half_extent,
+                center.y() - half_extent, center.y() + half_extent)
+
+    def visibleRange(self):
+        """ Оценивает видимый диапазон номеров отсчётов по текущим opts['distance'] и opts['center'].
+        :return: первый и последний видимые номера отсчётов и количество отсчётов на пиксель."""
+        half_extent = self.visibleHalfExtent()
+        center = self.opts['center'].y()
+        samples_per_pixel = 2 * half_extent / max(self.width(), self.height(), 1)
+        return center - half_extent, center + half_extent, samples_per_pixel
+
+    def viewChanged(self):
+        """ Обновляет содержимое графика после перемещения или масштабирования."""
+        self.updateLevelOfDetail()
+        self.grid.setViewRect(self.visibleRect())
+        self.updateAxisValues()
+
+    def setCameraPosition(self, *args, **kwargs):
+        """ Задаёт положение камеры и обновляет видимое содержимое графика."""
+        super().setCameraPosition(*args, **kwargs)
+        self.viewChanged()
+
+    @traced(category='lod')
+    def updateLevelOfDetail(self):
+        """ Загружает в линии только видимые части данных на подходящем уровне детализации.
+        Скрытые каналы не пересчитываются, их вершины удаляются из общего буфера
+        и строятся заново при отображении канала."""
+        if not self.lod_lines:
+            return
+        x_min, x_max, y_min, y_max = self.visibleRect()
+        _, _, samples_per_pixel = self.visibleRange()
+        # Запас в половину экрана с каждой стороны, чтобы при перемещении не было видно обрезанных краёв
+        margin = (y_max - y_min) / 2
+        view_rect = (x_min - margin, x_max + margin, y_min - margin, y_max + margin)
+        # Вершины всех каналов собираются в общий буфер один раз на обновление
+        channels_data = {}
+        for lines, channel, pyramid in self.lod_lines:
+            if lines.channel_visible[channel]:
+                channels_data.setdefault(lines, {})[channel] = pyramid.getVisible(view_rect, samples_per_pixel)
+            elif len(lines.channel_vertices[channel]):
+                channels_data.setdefault(lines, {})[channel] = np.empty((0, 3), dtype=np.float32)
+        for lines, data in channels_data.items():
+            lines.setChannelsData(data)
+
     def addGrid(self):
         """ Добавляет линии сетки."""
         for line in self.grid.getGrid():
             self.addItem(line)
 
-    def removeGrid(self):
-        """ Удаляет сетку."""
-        for line in self.grid.getGrid():
-            self.removeItem(line)
+    @traced(category='input')
     def doubleUpGrid(self):
         """ Увеличивает масштаб сетки в 2 раза."""
-        self.removeGrid()
         self.grid.doubleUpGridSpacing()
-        self.addGrid()
         self.scale_iterator = 0
 
+    @traced(category='input')
     def doubleDownGrid(self):
         """ Уменьшает масштаб сетки в 2 раза."""
-        self.removeGrid()
         self.grid.doubleDownGridSpacing()
-        self.addGrid()
         self.scale_iterator = 0
 
     def addAxisValues(self):
@@ -262,26 +1164,46 @@ class MyGLViewWidget(gl.GLViewWidget):
 
     def doubleUpTextValues(self):
         """ Увеличивает частоту подписей координатных осей в 2 раза."""
-        self.removeAxisValues()
-        self.axis_values.doubleUpTextSpacing()
-        self.addAxisValues()
+        for axis_value in self.axis_values.doubleUpTextSpacing():
+            self.addItem(axis_value)
 
     def doubleDownTextValues(self):
         """ Уменьшает частоту подписей координатных осей в 2 раза."""
-        self.removeAxisValues()
-        self.axis_values.doubleDownTextSpacing()
-        self.addAxisValues()
+        for axis_value in self.axis_values.doubleDownTextSpacing():
+            self.addItem(axis_value)
+
+    def updateAxisValues(self):
+        """ Оставляет подписи координатных осей только в видимой области."""
+        for axis_value in self.axis_values.setViewRect(self.visibleRect()):
+            self.addItem(axis_value)
 
 
 class Graphic3D(QDialog):
     """ Класс диалогового окна с графиком и кнопками отображения линий на нём."""
-    def __init__(self, data_array=None, parent=None, file_path=None, window_ind=0, experiment_time=10):
+    def __init__(self, data_array=None, parent=None, file_path=None, window_ind=0, experiment_time=10,
+                 checked_channels=None, stream_chunk_size=None, live_channels=None, history_length=100000,
+                 max_fps=30, channels=None, rows=None, cache=None, offscreen=False):
         """ Создание окна с графиком.
         :param data_array: массив значений для построения, в случае передачи пути файла не используется.
         :param parent: родительский класс (при наличии).
         :param file_path: путь к файлу со значениями для построения.
         :param window_ind: номер окна, в случае, если строится несколько графиков.
-        :param experiment_time: длительность эксперимента."""
+        :param experiment_time: длительность эксперимента.
+        :param checked_channels: номера каналов (с 0), отображаемых при открытии, если None -- все каналы.
+                                 Данные остальных каналов не загружаются, пока их не отметят.
+        :param stream_chunk_size: если задан, .csv файл читается в фоне частями по stream_chunk_size строк,
+                                  а линии дополняются по мере чтения.
+        :param live_channels: количество каналов для отображения в реальном времени, отсчёты передаются
+                              через append_samples().
+        :param history_length: количество последних отсчётов каждого канала, отображаемых в реальном времени.
+        :param max_fps: максимальная частота перерисовки в реальном времени, кадров в секунду.
+        :param channels: готовый источник каналов (например, загруженный batch_loader.load_files()),
+                         file_path в этом случае используется только для заголовка окна.
+        :param rows: диапазон строк (первая, после последней) для Parquet, Feather и HDF5 файлов,
+                     читаются только отсчёты из этого диапазона. Если None -- все строки.
+        :param cache: дисковый кэш ParseCache разобранных .csv и .xlsx файлов, если None -- файлы
+                      разбираются при каждом открытии.
+        :param offscreen: если True, окно создаётся, но не выводится на экран (для сохранения изображений)."""
         if parent is None:
             super().__init__()
         else:
@@ -294,47 +1216,106 @@ class Graphic3D(QDialog):
         self.experiment_time = experiment_time
         self.line_to_start = 0
         self.data = None
+        self.channels = channels
+        self.stream_chunk_size = stream_chunk_size
+        self.stream_loader = None
+        self.live_channels = live_channels
+        self.history_length = history_length
+        self.rows = rows
+        self.cache = cache
+        self.cache_entry = None
+
+        self.checked_channels = checked_channels
+        self.max_fps = max_fps
+        self.parse_in_background = False
+        self.loading_figures = set()    # названия фигур, данные которых готовятся в пуле потоков
+        self.lod_update_pending = False
+        self.graphic_widget = None
+        self.live_timer = None
 
         self.parse_input_data()
-        self.experiment_time = self.first_is_time_line()
+        if self.data is not None and self.stream_loader is not None:
+            self.experiment_time = self.first_is_time_line()
+            self.channels = GrowableChannels(self.data, self.line_to_start,
+                                             self.stream_loader.estimated_values_number)
 
         # Настройки внешнего вида окна
         self.window_width = 1500
         self.window_height = 1000
         self.resize(self.window_width, self.window_height)
         self.setWindowTitle(self.caption)
-
         self.figures = {}   # Массив фигур (пар вида линия - кнопка её отображения)
-        layout_v = QVBoxLayout()
 
-        # Импорт данных из датафрейма со значениями для построения.
-        channels = self.data.columns.tolist()[-1] + 1
-        values_number = self.data.index.tolist()[-1] + 1
-        y_max = max(self.data.iloc[:, 0].values.tolist())
-        x_max = values_number
+        # Разбор файлов и подготовка вершин выполняются в пуле потоков, окно показывается сразу
+        self.loader = LoaderPipeline()
+        self.loader.task_done.connect(self.loader_task_done)
+        self.loader.task_failed.connect(self.loader_task_failed)
+        self.loader.progress.connect(self.loader_progress)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        self.layout_h = QHBoxLayout()
+        self.layout_h.addWidget(self.progress_bar)
+        self.setLayout(self.layout_h)
+
+        if self.channels is None:
+            self.loader.submit('table', self.prepare_table)
+        else:
+            self.set_up_graphic()
+        if offscreen:
+            # Окно получает контекст OpenGL как показанное, но на экране не появляется
+            self.setAttribute(QtCore.Qt.WidgetAttribute.WA_DontShowOnScreen)
+        self.show()
 
-        self.lines = []
+    @traced(category='load')
+    def set_up_graphic(self):
+        """ Создаёт график, кнопки отображения линий и оси по готовому источнику каналов
+        и запускает подготовку данных отмеченных каналов."""
+        layout_v = QVBoxLayout()
+
+        # Импорт данных из источника каналов со значениями для построения.
+        channels = self.channels.channels_number
+        self.values_number = self.channels.values_number
+        x_max = self.values_number
+        if self.stream_loader is not None:
+            x_max = self.stream_loader.estimated_values_number
+        elif self.live_channels is not None:
+            x_max = self.history_length
+        checked_channels = self.checked_channels
+        if checked_channels is None:
+            checked_channels = range(channels)
+        checked_channels = set(checked_channels)
+
+        # Размеры осей и положение камеры определяются по индексу статистики без прохода по отсчётам.
+        # Каналы столбцовых файлов учитываются в индексе при первом чтении в пуле потоков, до этого
+        # оси строятся по количеству отсчётов
+        self.statistics = getattr(self.channels, 'statistics', None)
+        y_max = 0
+        if self.statistics is not None and channels:
+            y_max = max(y_max, np.nan_to_num(np.fmax.reduce(self.statistics.maximum)))
+        else:
+            # Без индекса статистики диапазон может потребовать чтения канала, поэтому неотмеченные
+            # каналы не учитываются
+            for channel in sorted(checked_channels & set(range(channels))):
+                y_max = max(y_max, self.channels.channelRange(channel)[1])
+        y_max = int(np.ceil(y_max))
+
+        # Все линии рисуются из общего буфера вершин, данные загружаются при первом отображении канала
+        mode = 'line_strip' if self.live_channels is not None else 'lines'
+        self.lines = PackedLinesItem(mode=mode, width=3, antialias=False, glOptions='translucent')
         # Добавляем линии и кнопки их отображения
-        for channel in range(self.line_to_start, channels):
-            key = f'channel_{channel + 1 - self.line_to_start}'
-            color = COLORS[channel]
+        for channel in range(channels):
+            key = f'channel_{channel + 1}'
+            if isinstance(self.channels, OverlayChannels):
+                key = self.channels.names[channel]
+            color = COLORS[(channel + self.line_to_start) % len(COLORS)]
 
             # Настройка кнопки отображения линии
             current_button = self.set_up_line_check_box(key, color)
+            current_button.setChecked(channel in checked_channels)
 
-            # Выбираем данные для построения линии
-            channel_data = self.data.iloc[:, channel].values.tolist()
-            channel_x_max = max(channel_data)
-            y_max = max(y_max, channel_x_max)
-            dots = []
-            for dot in range(len(channel_data)):
-                dots.append((channel_data[dot], dot, 0))
-
-            # Добавляем линию
-            dots_array = np.array(dots)
-            line = gl.GLLinePlotItem(pos = dots_array, width = 3, antialias = False, glOptions='translucent', color = color)
-            self.lines.append(line)
-            self.figures[key] = Figure(check_box=current_button, line=line, data=Points())
+            # Добавляем канал в общие линии
+            self.lines.addChannel(color, visible=current_button.isChecked())
+            self.figures[key] = Figure(check_box=current_button, data=Points(), channel=channel)
 
             layout_v.addWidget(current_button)
 
@@ -354,9 +1335,12 @@ class Graphic3D(QDialog):
         distance = max(y_max * 2, x_max * 2)
         self.graphic_widget.setCameraPosition(distance = distance, elevation = -90, azimuth = 0)
 
-        # Добавляем линии и оси на график
-        for l in  self.lines:
-            self.graphic_widget.addItem(l)
+        # Добавляем линии и оси на график, данные отмеченных линий готовятся в пуле потоков
+        for figure in self.figures.values():
+            if figure.check_box.isChecked():
+                self.request_channel(figure)
+        self.graphic_widget.addItem(self.lines)
+        self.graphic_widget.viewChanged()
         self.graphic_widget.addItem(axis_x)
         self.graphic_widget.addItem(axis_y)
 
@@ -368,49 +1352,342 @@ class Graphic3D(QDialog):
         layout_v.addWidget(true_all)
         layout_v.addWidget(false_all)
 
-        # Добавляем график и кнопки на окно приложения
-        layout_h = QHBoxLayout()
-        layout_h.addWidget(self.graphic_widget, 9)
-        layout_h.addLayout(layout_v, 1)
-        self.setLayout(layout_h)
-        self.show()
-
+        # Задаём кнопку масштабирования по значениям видимых линий
+        autoscale = QPushButton('Масштаб по данным')
+        autoscale.clicked.connect(self.autoscale)
+        layout_v.addWidget(autoscale)
+
+        # Запускаем чтение оставшейся части файла
+        if self.stream_loader is not None:
+            self.stream_loader.chunk_loaded.connect(self.extend_channels)
+            self.stream_loader.finished.connect(self.stream_finished)
+            self.stream_loader.start_loading(self.channels)
+
+        # Перерисовка в реальном времени не чаще max_fps раз в секунду, все дописанные между кадрами блоки
+        # отображаются за одну перерисовку
+        self.live_timer = None
+        if self.live_channels is not None:
+            self.live_timer = QtCore.QTimer(self)
+            self.live_timer.timeout.connect(self.refresh_live_channels)
+            self.live_timer.start(max(int(1000 / self.max_fps), 1))
+
+        # Добавляем график и кнопки на окно приложения, индикатор загрузки переносится под кнопки
+        self.layout_h.removeWidget(self.progress_bar)
+        layout_v.addWidget(self.progress_bar)
+        self.layout_h.addWidget(self.graphic_widget, 9)
+        self.layout_h.addLayout(layout_v, 1)
+
+    @traced(category='load')
+    def prepare_table(self):
+        """ Разбирает табличные данные (файл или массив) и строит по ним каналы с индексом статистики.
+        Выполняется в потоке пула, поэтому не обращается к виджетам."""
+        if self.data is None:
+            self.data = self.parse_file_data()
+        self.experiment_time = self.first_is_time_line()
+        channels = DataFrameChannels(self.data, self.line_to_start)
+        # Каналы скопированы в узкий тип данных, датафрейм больше не нужен
+        self.data = None
+        if self.cache is not None and self.file_path is not None:
+            self.cache_entry = self.cache.store(self.file_path, channels, self.experiment_time, self.line_to_start)
+        self.channels = channels
+
+    @traced(category='load')
+    def prepare_channel(self, channel, values_number):
+        """ Готовит уровни детализации канала. Выполняется в потоке пула.
+        :param channel: номер канала.
+        :param values_number: количество отсчётов канала.
+        :return: пирамида уровней детализации."""
+        return self.build_pyramid(channel, self.channels.channel(channel)[:values_number])
+
+    @traced(category='load')
+    def build_pyramid(self, channel, values):
+        """ Строит уровни детализации канала или восстанавливает их из кэша.
+        :param channel: номер канала.
+        :param values: отсчёты канала, становящиеся уровнем 0 без копирования.
+        :return: пирамида уровней детализации."""
+        if self.cache_entry is not None:
+            cached = self.cache_entry.loadPyramid(channel)
+            if cached is not None:
+                levels, chunk_bounds, parameters = cached
+                return DecimationPyramid.fromLevels([values] + levels, chunk_bounds, **parameters)
+        pyramid = DecimationPyramid(values)
+        # При потоковом чтении уровни могли строиться по части файла, такие уровни в кэш не сохраняются
+        if self.cache_entry is not None and pyramid.values_number == self.channels.values_number:
+            self.cache_entry.storePyramid(channel, *pyramid.cacheData())
+        return pyramid
+
+    def request_channel(self, figure):
+        """ Запрашивает данные линии. Уровни детализации строятся в пуле потоков, кроме отображения
+        в реальном времени, где линии перестраиваются целиком в refresh_live_channels().
+        При потоковом чтении уровни строятся по уже прочитанным отсчётам, остальные дописываются в load_channel().
+        :param figure: фигура вида линия - кнопка отображения."""
+        if self.live_channels is not None:
+            return
+        name = next(key for key, value in self.figures.items() if value is figure)
+        if figure.pyramid is not None or name in self.loading_figures:
+            return
+        self.loading_figures.add(name)
+        if self.stream_loader is not None:
+            # Каналы дописываются фоновым потоком, поэтому в пул передаются уже прочитанные отсчёты
+            values = self.channels.channel(figure.channel)[:self.values_number]
+            self.loader.submit(('channel', name), self.build_pyramid, figure.channel, values)
+        else:
+            self.loader.submit(('channel', name), self.prepare_channel, figure.channel, self.values_number)
+
+    def loader_task_done(self, key, result):
+        """ Событие завершения этапа фоновой загрузки. Выполняется в потоке интерфейса.
+        :param key: 'table' после разбора таблицы, ('channel', название фигуры) после подготовки линии
+                    или 'cache' после сохранения прочитанного частями файла в кэш.
+        :param result: результат этапа."""
+        if key == 'table':
+            self.set_up_graphic()
+            return
+        if key == 'cache':
+            self.cache_entry = result
+            self.statistics = self.channels.statistics
+            return
+        _, name = key
+        self.loading_figures.discard(name)
+        figure = self.figures[name]
+        figure.pyramid = result
+        # Отсчёты, прочитанные за время построения уровней, дописываются в них
+        self.load_channel(figure)
+        self.graphic_widget.addLodLine(self.lines, figure.channel, figure.pyramid)
+        # Готовые подряд линии загружаются в буфер одним обновлением
+        if not self.lod_update_pending:
+            self.lod_update_pending = True
+            QtCore.QTimer.singleShot(0, self.update_loaded_lines)
+
+    @traced(category='load')
+    def update_loaded_lines(self):
+        """ Загружает в буфер видимые части линий, подготовленных с прошлого обновления."""
+        self.lod_update_pending = False
+        if self.graphic_widget is not None:
+            self.graphic_widget.updateLevelOfDetail()
+
+    def loader_task_failed(self, key, message):
+        """ Событие ошибки этапа фоновой загрузки.
+        :param key: ключ этапа.
+        :param message: описание ошибки."""
+        if key not in ('table', 'cache'):
+            self.loading_figures.discard(key[1])
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setFormat(f"Ошибка загрузки: {message}")
+
+    def loader_progress(self, completed, submitted):
+        """ Отображает ход фоновой загрузки.
+        :param completed: количество завершённых этапов.
+        :param submitted: количество поставленных этапов."""
+        if self.progress_bar.format().startswith("Ошибка"):
+            return
+        self.progress_bar.setMaximum(submitted)
+        self.progress_bar.setValue(completed)
+        self.progress_bar.setVisible(completed < submitted)
+
+    def wait_until_loaded(self):
+        """ Дожидается окончания фоновой загрузки и обработки её результатов в потоке интерфейса."""
+        while not self.loader.isIdle() and not self.loader.cancelled.is_set():
+            self.loader.pool.waitForDone()
+            QtWidgets.QApplication.processEvents()
+        QtWidgets.QApplication.processEvents()
+
+    @traced(category='load')
     def parse_file_data(self):
         """ Разбирает поданный на вход файл.
         :return: датафрейм с набором значений для отображения."""
-        _, file_extension = os.path.splitext(self.file_path)
-        data = None
-        if file_extension == '.csv':
-            data = pd.read_csv(filepath_or_buffer=self.file_path, sep=';', header=None)
-        elif file_extension == '.xlsx':
-            data = pd.read_excel(io=self.file_path)
-        return data
+        return read_table(self.file_path)
 
     def  parse_input_data(self):
-        """ Обрабатывает входные данные в зависимости от их вида (массив/путь файла)."""
-        if self.file_path is not None:
-            self.data = self.parse_file_data()
+        """ Обрабатывает входные данные в зависимости от их вида (готовые каналы/массив/путь файла)."""
+        if self.channels is not None:
+            self.experiment_time = getattr(self.channels, 'experiment_time', self.experiment_time)
+            if self.file_path is not None:
+                self.caption = f"{find_file_name(self.file_path)} осциллограмма"
+            else:
+                self.caption = f"Осциллограмма №{self.window_ind + 1}"
+        elif self.file_path is not None:
+            _, file_extension = os.path.splitext(self.file_path)
+            if self.cache is not None and file_extension in ('.csv', '.xlsx'):
+                self.cache_entry = self.cache.lookup(self.file_path)
+            if self.cache_entry is not None:
+                # Файл уже разбирался: каналы и уровни детализации отображаются в память из кэша
+                self.channels = self.cache_entry.capture()
+                self.experiment_time = self.channels.experiment_time
+                self.line_to_start = self.cache_entry.firstChannel()
+            elif file_extension == CAPTURE_EXTENSION:
+                # Двоичный файл отображается в память, каналы читаются с диска по мере отображения
+                self.channels = CaptureFile(self.file_path)
+                self.experiment_time = self.channels.experiment_time
+            elif file_extension in COLUMNAR_EXTENSIONS:
+                # Столбцовые форматы: каналы и диапазон строк читаются по мере отображения
+                self.channels = open_columnar(self.file_path, self.rows, self.experiment_time)
+                self.experiment_time = self.channels.experiment_time
+            elif file_extension == '.csv' and self.stream_chunk_size:
+                # Сразу читается только первая часть файла, остальное -- в фоновом потоке
+                self.stream_loader = CsvStreamLoader(self.file_path, self.stream_chunk_size)
+                self.data = self.stream_loader.first_chunk
             self.caption = f"{find_file_name(self.file_path)} осциллограмма"
         elif self.data_array is not None:
             self.data = pd.DataFrame(self.data_array)
             self.caption = f"Осциллограмма №{self.window_ind + 1}"
+        elif self.live_channels is not None:
+            self.channels = RingChannels(self.live_channels, self.history_length)
+            self.caption = f"Осциллограмма №{self.window_ind + 1}"
 
+    @traced(category='load')
+    def load_channel(self, figure):
+        """ Дописывает в уровни детализации линии отсчёты канала, прочитанные после их построения.
+        :param figure: фигура вида линия - кнопка отображения."""
+        if figure.pyramid is None or figure.pyramid.values_number >= self.values_number:
+            return
+        figure.pyramid.extend(self.channels.channel(figure.channel)[:self.values_number])
+
+    def extend_channels(self, values_number):
+        """ Дополняет загруженные линии отсчётами, прочитанными в фоновом потоке.
+        :param values_number: количество прочитанных отсчётов в каждом канале."""
+        self.values_number = values_number
+        for figure in self.figures.values():
+            if figure.pyramid is not None:
+                self.load_channel(figure)
+        self.graphic_widget.updateLevelOfDetail()
+
+    def stream_finished(self):
+        """ Событие завершения фонового чтения файла. Если файл прочитан полностью, освобождает память,
+        выделенную каналам сверх прочитанного, и сохраняет каналы и уже построенные уровни детализации в кэш."""
+        if not self.stream_loader.completed:
+            return
+        # Память каналов выделялась по оценке количества строк, лишняя освобождается
+        self.channels.trim()
+        for figure in self.figures.values():
+            if figure.pyramid is not None:
+                figure.pyramid.extend(self.channels.channel(figure.channel)[:self.values_number])
+        if self.cache is None:
+            return
+        # Запись всех каналов на диск и построение индекса статистики занимают секунды для больших файлов,
+        # поэтому выполняются в пуле потоков
+        self.loader.submit('cache', self.store_stream)
+
+    @traced(category='load')
+    def store_stream(self):
+        """ Строит индекс статистики прочитанных частями каналов и сохраняет каналы и уже построенные
+        уровни детализации в кэш. Выполняется в потоке пула после окончания чтения файла.
+        :return: запись кэша."""
+        self.channels.statistics = ChannelStatistics.fromSource(self.channels)
+        cache_entry = self.cache.store(self.file_path, self.channels, self.experiment_time, self.line_to_start)
+        for figure in list(self.figures.values()):
+            if figure.pyramid is not None:
+                cache_entry.storePyramid(figure.channel, *figure.pyramid.cacheData())
+        return cache_entry
+
+    def append_samples(self, block):
+        """ Дописывает отсчёты для отображения в реальном времени. Может вызываться из любого потока,
+        перерисовка происходит по таймеру.
+        :param block: массив формы (отсчёты, каналы) или один отсчёт всех каналов."""
+        self.channels.append(block)
+
+    @traced(category='live')
+    def refresh_live_channels(self):
+        """ Перерисовывает отмеченные линии по отсчётам, дописанным с прошлого кадра.
+        Самый новый отсчёт располагается у правого края окна истории."""
+        values_number = self.channels.values_number
+        if values_number == self.values_number:
+            return
+        self.values_number = values_number
+        # На каждый пиксель ширины графика достаточно минимума и максимума
+        target_points = 2 * max(self.graphic_widget.width(), self.graphic_widget.height())
+        channels_data = {}
+        for figure in self.figures.values():
+            if not figure.check_box.isChecked():
+                continue
+            values, _ = self.channels.snapshot(figure.channel)
+            vertices = build_channel_vertices(values, first_index=self.history_length - len(values))
+            group_size = 2 * len(vertices) // target_points
+            if group_size > 1:
+                vertices = DecimationPyramid.decimate(vertices, group_size)
+            channels_data[figure.channel] = vertices
+        self.lines.setChannelsData(channels_data)
+
+    def values_range(self, channels, first, last):
+        """ Оценивает диапазон значений каналов на диапазоне отсчётов.
+        При наличии индекса статистики оценка вычисляется по блокам (ещё не прочитанные каналы не учитываются),
+        иначе -- по диапазонам каналов целиком.
+        :param channels: номера каналов.
+        :param first: первый номер отсчёта.
+        :param last: последний номер отсчёта.
+        :return: минимум и максимум или None, если значений нет."""
+        if self.statistics is not None:
+            return self.statistics.rangeMinMax(first, last, channels)
+        ranges = np.array([self.channels.channelRange(channel) for channel in channels], dtype=np.float64)
+        if not len(ranges) or np.isnan(ranges).all():
+            return None
+        return np.nanmin(ranges[:, 0]), np.nanmax(ranges[:, 1])
+
+    def autoscale(self):
+        """ Событие нажатия на кнопку масштабирования по данным.
+        Центрирует график по значениям отмеченных линий на видимом диапазоне отсчётов и приближает его так,
+        чтобы эти значения и текущий диапазон отсчётов помещались в окне."""
+        first, last, _ = self.graphic_widget.visibleRange()
+        channels = [figure.channel for figure in self.figures.values() if figure.check_box.isChecked()]
+        values_range = self.values_range(channels, first, last)
+        if values_range is None:
+            return
+        minimum, maximum = values_range
+        widget = self.graphic_widget
+        center = widget.opts['center']
+        half_extent = max((maximum - minimum) / 2, (last - first) / 2, 1)
+        # Обратное к MyGLViewWidget.visibleHalfExtent() преобразование
+        scale = widget.visibleHalfExtent() / widget.opts['distance']
+        widget.opts['center'] = Vector((minimum + maximum) / 2, center.y(), 0)
+        widget.setCameraPosition(distance=half_extent / scale)
+
+    def closeEvent(self, event):
+        """ Событие закрытия окна. Отменяет фоновую загрузку, останавливает чтение файла и перерисовку
+        в реальном времени."""
+        self.loader.cancel()
+        if self.stream_loader is not None:
+            self.stream_loader.stop()
+        if self.live_timer is not None:
+            self.live_timer.stop()
+        super().closeEvent(event)
+
+    @traced(category='input')
     def press_check_box(self, figure_name):
         """ Событие нажатие на кнопку отображения линии.
         Скрывает или показывает соответствующую линию.
         :param figure_name: фигура вида линия - кнопка отображения."""
-        if self.figures[figure_name].check_box.isChecked():
-            self.graphic_widget.addItem(self.figures[figure_name].line)
-        else:
-            self.graphic_widget.removeItem(self.figures[figure_name].line)
+        self.set_figures_visible([self.figures[figure_name]], self.figures[figure_name].check_box.isChecked())
+
+    def set_figures_visible(self, figures, is_visible):
+        """ Меняет видимость линий в общем буфере. Данные ещё не загруженных каналов загружаются,
+        вершины отображаемых каналов строятся по текущей видимой области, после чего график перерисовывается один раз.
+        :param figures: фигуры вида линия - кнопка отображения.
+        :param is_visible: true - для отображения линий, false - для скрытия."""
+        loaded = False
+        if is_visible:
+            for figure in figures:
+                if figure.pyramid is None and self.live_channels is None:
+                    self.request_channel(figure)
+                # Данные, подготовленные синхронно, загружаются сразу, остальные -- по готовности
+                loaded = loaded or figure.pyramid is not None
+        if is_visible and self.live_channels is not None:
+            # Скрытые каналы не перерисовывались, поэтому их данные обновляются в следующем кадре
+            self.values_number = None
+        self.lines.setChannelsVisible({figure.channel: is_visible for figure in figures})
+        if loaded:
+            # Скрытые каналы не пересчитывались при перемещении, поэтому их вершины строятся заново
+            self.graphic_widget.updateLevelOfDetail()
 
     def change_all_check_boxes(self, is_check: bool):
         """ Изменение отображения всех линий на графике.
         :param is_check: true - для отображения всех линий, false - для скрытия всех линий."""
-        for name in self.figures.keys():
-            state = self.figures[name].check_box.isChecked()
-            if state != is_check:
-                self.figures[name].check_box.click()
+        changed = []
+        for figure in self.figures.values():
+            if figure.check_box.isChecked() != is_check:
+                # setChecked() не вызывает press_check_box(), видимость меняется одним вызовом ниже
+                figure.check_box.setChecked(is_check)
+                changed.append(figure)
+        if changed:
+            self.set_figures_visible(changed, is_check)
 
     def change_all_check_boxes_true(self):
         """ Сменяет значение всех кнопок для линий. Отображает все линии на графике."""
@@ -429,30 +1706,84 @@ class Graphic3D(QDialog):
         current_button.setChecked(True)
         current_style = "QCheckBox::indicator:checked {background-color: " + color + ";}"
         current_button.setStyleSheet(current_style)
-        current_button.clicked.connect(partial(self.press_check_box, key))
+        # Флаг checked сигнала clicked отбрасывается: обёртка замера времени передаёт функции все аргументы
+        current_button.clicked.connect(lambda checked, name=key: self.press_check_box(name))
 
         return current_button
 
+    @traced(category='load')
     def first_is_time_line(self):
-        """ Проверяет первую строку на соответствие строке со временем.
+        """ Проверяет первую строку на соответствие строке со временем и отделяет её от данных (см. split_time_line()).
         :return: новое время эксперимента, если строка содержит только одно число,
                  в противном случае -- указанное при запуске программы."""
-        first_line_list = self.data.values.tolist()[0]
-        would_be_time = first_line_list[0]
-        for item in first_line_list[1::]:
-            if not np.isnan(item):
-                return self.experiment_time
-        self.line_to_start = 1
-        return would_be_time
+        self.data, self.line_to_start, experiment_time = split_time_line(self.data, self.experiment_time)
+        return experiment_time
+
+
+def run_batch(patterns, experiment_time, overlay=False, processes=None):
+    """ Открывает несколько осциллограмм, загруженных параллельно в пуле процессов.
+    :param patterns: пути к файлам или шаблоны вида captures/*.csv.
+    :param experiment_time: длительность эксперимента для файлов без строки со временем.
+    :param overlay: True -- все осциллограммы на одном графике, False -- отдельное окно для каждой.
+    :param processes: количество процессов пула, по умолчанию -- количество ядер.
+    :return: код завершения приложения."""
+    file_paths = expand_paths(patterns)
+    app = QtWidgets.QApplication(sys.argv)
+    sources, errors = load_files(file_paths, experiment_time=experiment_time, processes=processes)
+    for file_path, error in errors.items():
+        print(f"{file_path}: {error}", file=sys.stderr)
+    # Файлы, которые не удалось загрузить, не отображаются
+    file_paths = [file_path for file_path, source in zip(file_paths, sources) if source is not None]
+    sources = [source for source in sources if source is not None]
+    if not sources:
+        return 1
+    if overlay:
+        names = [find_file_name(file_path) for file_path in file_paths]
+        windows = [Graphic3D(channels=OverlayChannels(sources, names))]
+    else:
+        windows = [Graphic3D(channels=source, file_path=file_path, window_ind=ind)
+                   for ind, (source, file_path) in enumerate(zip(sources, file_paths))]
+    exit_code = app.exec_()
+    for source in sources:
+        source.close()
+    TRACER.exportChromeTrace()
+    return exit_code
 
 
 if __name__ == '__main__':
     data_array = [[68, 70, 69, 67, 68, 67, 67, 68, 70, 70, 69, 71, 69, 71, 68, 70, 69, 69], [18, 20, 19, 17, 18, 17, 17, 18, 20, 20, 19, 21, 19, 21, 18, 20, 19, 19], [28, 30, 29, 27, 28, 27, 27, 28, 30, 30, 29, 31, 29, 31, 28, 30, 29, 29], [38, 40, 39, 37, 38, 37, 37, 38, 40, 40, 39, 41, 39, 41, 38, 40, 39, 39], [48, 50, 49, 47, 48, 47, 47, 48, 50, 50, 49, 51, 49, 51, 48, 50, 49, 49], [58, 60, 59, 57, 58, 57, 57, 58, 60, 60, 59, 61, 59, 61, 58, 60, 59, 59], [68, 70, 69, 67, 68, 67, 67, 68, 70, 70, 69, 71, 69, 71, 68, 70, 69, 69], [78, 80, 79, 77, 78, 77, 77, 78, 80, 80, 79, 81, 79, 81, 78, 80, 79, 79], [88, 90, 89, 87, 88, 87, 87, 88, 90, 90, 89, 91, 89, 91, 88, 90, 89, 89], [98, 100, 99, 97, 98, 97, 97, 98, 100, 100, 99, 101, 99, 101, 98, 100, 99, 99], [108, 110, 109, 107, 108, 107, 107, 108, 110, 110, 109, 111, 109, 111, 108, 110, 109, 109], [118, 120, 119, 117, 118, 117, 117, 118, 120, 120, 119, 121, 119, 121, 118, 120, 119, 119]]
-    file_path = "small_test.csv"
-    experiment_time = 5
-    if len(sys.argv) > 2:
-        file_path = sys.argv[1]
-        experiment_time = sys.argv[2]
+    parser = argparse.ArgumentParser(description="Построение осциллограмм.")
+    parser.add_argument("file_path", nargs="?", default="small_test.csv")
+    parser.add_argument("experiment_time", nargs="?", type=float, default=5)
+    parser.add_argument("--batch", nargs="+", metavar="PATH", help="несколько файлов или шаблонов вида captures/*.csv")
+    parser.add_argument("--overlay", action="store_true", help="отобразить все файлы --batch на одном графике")
+    parser.add_argument("--processes", type=int, default=None, help="количество процессов для загрузки --batch")
+    parser.add_argument("--rows", nargs=2, type=int, metavar=("FIRST", "LAST"), default=None,
+                        help="диапазон строк для Parquet, Feather и HDF5 файлов")
+    parser.add_argument("--channels", nargs="+", type=int, default=None,
+                        help="номера каналов (с 0), отображаемых при открытии")
+    parser.add_argument("--no-cache", action="store_true", help="не использовать кэш разобранных файлов")
+    parser.add_argument("--cache-dir", default=None, help="каталог кэша разобранных файлов")
+    parser.add_argument("--cache-size-mb", type=float, default=None, help="наибольший размер кэша в мегабайтах")
+    parser.add_argument("--trace", action="store_true",
+                        help="замерять время кадров, обработки событий и этапов загрузки")
+    parser.add_argument("--trace-overlay", action="store_true",
+                        help="выводить частоту кадров и задержки поверх графика (включает --trace)")
+    parser.add_argument("--trace-file", default=None,
+                        help="сохранить замеры при выходе в файл формата Chrome trace (включает --trace)")
+    args = parser.parse_args()
+
+    if args.trace or args.trace_overlay or args.trace_file:
+        TRACER.enable(overlay=args.trace_overlay, file_path=args.trace_file)
+    if args.batch:
+        sys.exit(run_batch(args.batch, args.experiment_time, args.overlay, args.processes))
+    cache = None
+    if not args.no_cache:
+        size_limit = int(args.cache_size_mb * (1 << 20)) if args.cache_size_mb is not None else None
+        cache = ParseCache(args.cache_dir, size_limit)
     app = QtWidgets.QApplication(sys.argv)
-    g = Graphic3D(file_path=file_path, experiment_time=experiment_time)
-    sys.exit(app.exec_())
+    g = Graphic3D(file_path=args.file_path, experiment_time=args.experiment_time, stream_chunk_size=65536,
+                  checked_channels=args.channels, rows=args.rows, cache=cache)
+    exit_code = app.exec_()
+    TRACER.exportChromeTrace()
+    sys.exit(exit_code)
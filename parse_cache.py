@@ -0,0 +1,202 @@
+""" Дисковый кэш разобранных осциллограмм.
+
+Запись кэша -- каталог, имя которого определяется путём, размером, временем изменения и хэшем содержимого
+исходного файла. В каталоге хранятся:
+    source.json -- номер столбца исходной таблицы, с которого начинаются каналы;
+    capture.fgc -- каналы, время эксперимента и индекс статистики в формате capture_file.py,
+    записывается последним из них и отмечает запись как готовую;
+    channel_<номер>_level_<уровень>.npy и channel_<номер>_bounds_<уровень>.npy -- значения вершин уровней
+    детализации канала начиная с первого (уровень 0 -- сами отсчёты из capture.fgc) и ограничивающие
+    прямоугольники частей всех уровней;
+    channel_<номер>.json -- параметры уровней детализации канала, записывается последним.
+При повторном открытии все файлы отображаются в память. Общий размер кэша ограничен, при превышении
+удаляются записи, которые дольше всего не открывались."""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from capture_file import CaptureFile, write_capture
+
+CACHE_VERSION = 3
+CACHE_DIRECTORY_VARIABLE = 'FGP_CACHE_DIR'
+CACHE_SIZE_VARIABLE = 'FGP_CACHE_SIZE_MB'
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'fast_graphics_plotting')
+DEFAULT_SIZE_LIMIT = 10 * (1 << 30)
+CAPTURE_NAME = 'capture.fgc'
+SOURCE_NAME = 'source.json'
+
+
+def file_key(file_path, sample_size=1 << 20):
+    """ Вычисляет ключ записи кэша для файла.
+    Хэш содержимого считается по первым и последним sample_size байтам, чтобы время вычисления ключа
+    не зависело от размера файла; изменение середины файла без изменения размера и времени изменения
+    не обнаруживается.
+    :param file_path: путь к исходному файлу.
+    :param sample_size: количество байт в начале и в конце файла, по которым считается хэш.
+    :return: ключ записи в виде шестнадцатеричной строки."""
+    stat = os.stat(file_path)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{CACHE_VERSION}\0{os.path.abspath(file_path)}\0{stat.st_size}\0{stat.st_mtime_ns}'.encode())
+    with open(file_path, 'rb') as file:
+        digest.update(file.read(sample_size))
+        if stat.st_size > sample_size:
+            file.seek(max(stat.st_size - sample_size, sample_size))
+            digest.update(file.read(sample_size))
+    return digest.hexdigest()
+
+
+class CacheEntry:
+    """ Класс записи кэша одного исходного файла."""
+    def __init__(self, directory):
+        """ :param directory: каталог записи."""
+        self.directory = directory
+
+    def capture(self):
+        """ :return: каналы записи CaptureFile, отображённые в память."""
+        return CaptureFile(os.path.join(self.directory, CAPTURE_NAME))
+
+    def firstChannel(self):
+        """ :return: номер столбца исходной таблицы, с которого начинаются каналы."""
+        try:
+            with open(os.path.join(self.directory, SOURCE_NAME)) as file:
+                return json.load(file)['first_channel']
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def storePyramid(self, channel, levels, chunk_bounds, parameters):
+        """ Сохраняет уровни детализации канала.
+        :param channel: номер канала.
+        :param levels: значения вершин уровней начиная с первого.
+        :param chunk_bounds: ограничивающие прямоугольники частей всех уровней (по четыре массива на уровень).
+        :param parameters: параметры построения уровней (словарь, сохраняемый в json)."""
+        for level, values in enumerate(levels, start=1):
+            self._save(f'channel_{channel}_level_{level}.npy', values)
+        for level, bounds in enumerate(chunk_bounds):
+            self._save(f'channel_{channel}_bounds_{level}.npy', np.stack(bounds))
+        parameters = dict(parameters, levels_number=len(chunk_bounds))
+        self._write(f'channel_{channel}.json', lambda file: file.write(json.dumps(parameters).encode()))
+
+    def loadPyramid(self, channel):
+        """ Отображает в память сохранённые уровни детализации канала.
+        :param channel: номер канала.
+        :return: значения вершин уровней начиная с первого, ограничивающие прямоугольники частей всех уровней
+                 и параметры построения или None, если уровни канала не сохранены."""
+        try:
+            with open(os.path.join(self.directory, f'channel_{channel}.json')) as file:
+                parameters = json.load(file)
+            levels_number = parameters.pop('levels_number')
+            levels = [np.load(os.path.join(self.directory, f'channel_{channel}_level_{level}.npy'), mmap_mode='r')
+                      for level in range(1, levels_number)]
+            chunk_bounds = [list(np.load(os.path.join(self.directory, f'channel_{channel}_bounds_{level}.npy')))
+                            for level in range(levels_number)]
+        except (OSError, ValueError, KeyError):
+            return None
+        return levels, chunk_bounds, parameters
+
+    def _save(self, name, array):
+        """ Сохраняет массив в файл .npy записи."""
+        self._write(name, lambda file: np.save(file, np.ascontiguousarray(array)))
+
+    def _write(self, name, write):
+        """ Записывает файл записи через временный файл, чтобы при сбое не оставалось недописанных файлов.
+        :param name: имя файла в каталоге записи.
+        :param write: функция, записывающая содержимое в открытый файл."""
+        handle, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                write(file)
+            os.replace(temporary_path, os.path.join(self.directory, name))
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+
+class ParseCache:
+    """ Класс дискового кэша разобранных файлов с ограничением размера и вытеснением давно не открывавшихся записей."""
+    def __init__(self, directory=None, size_limit=None):
+        """ :param directory: каталог кэша, по умолчанию -- из переменной окружения FGP_CACHE_DIR
+                              или ~/.cache/fast_graphics_plotting.
+        :param size_limit: наибольший общий размер записей в байтах, по умолчанию -- из переменной окружения
+                           FGP_CACHE_SIZE_MB или 10 ГиБ."""
+        if directory is None:
+            directory = os.environ.get(CACHE_DIRECTORY_VARIABLE, DEFAULT_CACHE_DIRECTORY)
+        if size_limit is None:
+            size_limit = DEFAULT_SIZE_LIMIT
+            if os.environ.get(CACHE_SIZE_VARIABLE):
+                size_limit = int(float(os.environ[CACHE_SIZE_VARIABLE]) * (1 << 20))
+        self.directory = directory
+        self.size_limit = size_limit
+        os.makedirs(self.directory, exist_ok=True)
+
+    def lookup(self, file_path):
+        """ Ищет запись кэша для файла и отмечает её как недавно использованную.
+        :param file_path: путь к исходному файлу.
+        :return: запись CacheEntry или None, если файл ещё не разбирался или изменился."""
+        directory = os.path.join(self.directory, file_key(file_path))
+        if not os.path.exists(os.path.join(directory, CAPTURE_NAME)):
+            return None
+        os.utime(directory)
+        return CacheEntry(directory)
+
+    def store(self, file_path, channels, experiment_time, first_channel=0):
+        """ Сохраняет разобранные каналы файла в новую запись кэша.
+        :param file_path: путь к исходному файлу.
+        :param channels: источник каналов (DataFrameChannels, GrowableChannels и т.п.).
+        :param experiment_time: время эксперимента.
+        :param first_channel: номер столбца исходной таблицы, с которого начинаются каналы.
+        :return: запись CacheEntry."""
+        directory = os.path.join(self.directory, file_key(file_path))
+        os.makedirs(directory, exist_ok=True)
+        entry = CacheEntry(directory)
+        source = json.dumps({'file_path': os.path.abspath(file_path), 'first_channel': first_channel})
+        entry._write(SOURCE_NAME, lambda file: file.write(source.encode()))
+        arrays = [channels.channel(index)[:channels.values_number] for index in range(channels.channels_number)]
+        temporary_path = os.path.join(directory, CAPTURE_NAME + '.tmp')
+        write_capture(temporary_path, arrays, experiment_time, statistics=getattr(channels, 'statistics', None))
+        os.replace(temporary_path, os.path.join(directory, CAPTURE_NAME))
+        self.evict(keep=directory)
+        return entry
+
+    def entries(self):
+        """ :return: пары (время последнего использования, каталог) всех записей кэша."""
+        entries = []
+        for name in os.listdir(self.directory):
+            directory = os.path.join(self.directory, name)
+            if os.path.isdir(directory):
+                entries.append((os.stat(directory).st_mtime, directory))
+        return entries
+
+    def evict(self, keep=None):
+        """ Удаляет записи, которые дольше всего не использовались, пока общий размер кэша превышает ограничение.
+        :param keep: каталог записи, которую удалять нельзя (например, только что созданной)."""
+        entries = sorted(self.entries())
+        sizes = {directory: directory_size(directory) for _, directory in entries}
+        total = sum(sizes.values())
+        for _, directory in entries:
+            if total <= self.size_limit:
+                break
+            if directory == keep:
+                continue
+            shutil.rmtree(directory, ignore_errors=True)
+            total -= sizes[directory]
+
+    def clear(self):
+        """ Удаляет все записи кэша."""
+        for _, directory in self.entries():
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def directory_size(directory):
+    """ :return: суммарный размер файлов каталога в байтах."""
+    size = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
@@ -0,0 +1,71 @@
+""" Проверки уровней детализации DecimationPyramid: минимумы и максимумы каждого блока отсчётов
+сохраняются на всех уровнях, в том числе при дописывании отсчётов и пропусках (NaN).
+
+Запуск: python -m pytest -q test_decimation.py"""
+import numpy as np
+import pytest
+
+from main import DecimationPyramid
+
+
+def assert_extrema_kept(pyramid, values):
+    """ Проверяет, что на каждом уровне две вершины каждого блока -- минимум и максимум его отсчётов."""
+    for level in range(1, len(pyramid.levels)):
+        bucket_size = pyramid.bucket_sizes[level]
+        level_values = np.asarray(pyramid.levels[level], dtype=np.float64)
+        blocks_number = -(-len(values) // bucket_size)
+        assert len(level_values) == 2 * blocks_number
+        for block in range(blocks_number):
+            block_values = np.asarray(values[block * bucket_size:(block + 1) * bucket_size], dtype=np.float64)
+            pair = level_values[2 * block:2 * block + 2]
+            if np.isnan(block_values).all():
+                continue
+            with np.errstate(invalid='ignore'):
+                assert np.nanmin(pair) == np.nanmin(block_values)
+                assert np.nanmax(pair) == np.nanmax(block_values)
+
+
+@pytest.mark.parametrize("dtype", [np.int16, np.float32])
+def test_random_extrema_survive(dtype):
+    rng = np.random.default_rng(0)
+    values = rng.integers(-1000, 1000, 50000).astype(dtype)
+    pyramid = DecimationPyramid(values, min_level_size=64)
+    assert len(pyramid.levels) > 3
+    assert_extrema_kept(pyramid, values)
+
+
+def test_single_spike_survives():
+    values = np.zeros(100000, dtype=np.float32)
+    values[77777] = 500
+    pyramid = DecimationPyramid(values, min_level_size=16)
+    for level in pyramid.levels:
+        assert np.nanmax(level) == 500
+
+
+def test_extend_matches_full_build():
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=30001).astype(np.float32)
+    full = DecimationPyramid(values, min_level_size=32)
+    incremental = DecimationPyramid(values[:1000], min_level_size=32)
+    for end in (1001, 4097, 12345, 30001):
+        incremental.extend(values[:end])
+    assert len(incremental.levels) == len(full.levels)
+    for incremental_level, full_level in zip(incremental.levels, full.levels):
+        np.testing.assert_array_equal(incremental_level, full_level)
+    for level in range(len(full.levels)):
+        for incremental_bounds, full_bounds in zip(incremental.chunkBounds(level), full.chunkBounds(level)):
+            np.testing.assert_array_equal(incremental_bounds, full_bounds)
+
+
+def test_nan_does_not_hide_extrema():
+    # Пропуски в начале канала и внутри блока
+    values = np.zeros(20000, dtype=np.float32)
+    values[0] = np.nan
+    values[3] = 500
+    values[15000:15010] = np.nan
+    values[15011] = -300
+    pyramid = DecimationPyramid(values, min_level_size=16)
+    for level in pyramid.levels[1:]:
+        assert np.nanmax(level) == 500
+        assert np.nanmin(level) == -300
+    assert_extrema_kept(pyramid, values)